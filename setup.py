@@ -39,4 +39,10 @@ setup(
         "beautifulsoup4",
         "requests"
     ],
+    extras_require={                             # Optional speedups: faster JSON and zstd wire compression
+        "fast": [
+            "orjson>=3.9.0",
+            "zstandard>=0.21.0"
+        ]
+    },
 )
\ No newline at end of file
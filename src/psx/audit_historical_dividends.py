@@ -3,8 +3,9 @@ import json
 import time
 import argparse
 from datetime import datetime
-from pymongo import MongoClient
 import requests
+from psx.data_store import get_client
+from psx.mongodb_helpers import test_mongo_connectivity
 
 try:
     from dotenv import load_dotenv  # type: ignore
@@ -71,25 +72,21 @@ def main():
     print(f"HISTORICAL DIVIDEND AUDIT (Stocks {args.start} to {args.end})")
     print("=" * 80)
     
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        db = client[db_name]
-        print(f"Connected to MongoDB database: {db_name}")
-    except Exception as e:
-        print(f"MongoDB connection failed: {e}")
+    if not test_mongo_connectivity(connection_string, db_name):
         return
+    db = get_client(connection_string)[db_name]
 
     # Calculate skip and limit for pagination
     # Note: start is 1-based, so skip = start - 1
     skip_count = max(0, args.start - 1)
     limit_count = max(1, args.end - skip_count)
 
-    # Fetch stocks sorted by marketCap descending
+    # Fetch stocks sorted by marketCap descending (_id breaks ties so rank
+    # slices are stable across runs)
     stocks_cursor = db['stocks'].find(
         {"isActive": True}, 
         {"symbol": 1, "marketCap": 1, "_id": 0}
-    ).sort("marketCap", -1).skip(skip_count).limit(limit_count)
+    ).sort([("marketCap", -1), ("_id", 1)]).skip(skip_count).limit(limit_count)
 
     stocks = list(stocks_cursor)
     print(f"Retrieved {len(stocks)} stocks from database to process.")
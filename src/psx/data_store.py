@@ -3,16 +3,125 @@ MongoDB storage functionality for PSX stock data.
 This module provides functions to store stock data in MongoDB.
 """
 
+import atexit
+import functools
+import bson
 import pymongo
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+import numpy as np
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, time
+import threading
+import queue
 import logging
+import logging.handlers
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# One MongoClient (and its connection pool) per connection string, shared by
+# every call in the process
+_client_cache = {}
+_client_lock = threading.Lock()
+
+# MongoDB server error code for unique index violations
+DUPLICATE_KEY_ERROR = 11000
+
+# Connections per MongoClient pool; every script in the process shares one
+# client per connection string through get_client()
+MONGO_MAX_POOL_SIZE = 32
+
+# Wire compression offered to the server, best first; zstd and snappy are
+# only offered when their optional packages are installed
+MONGO_COMPRESSORS = ["zlib"]
+try:
+    import snappy  # type: ignore
+    MONGO_COMPRESSORS.insert(0, "snappy")
+except ImportError:
+    pass
+try:
+    import zstandard  # type: ignore
+    MONGO_COMPRESSORS.insert(0, "zstd")
+except ImportError:
+    pass
+
+# Write concern for operational bookkeeping collections (failed intervals,
+# completeness metadata): losing a record only means redoing some work, so
+# these writes wait for the primary's ack but not its journal
+BOOKKEEPING_WRITE_CONCERN = pymongo.WriteConcern(w=1, j=False)
+
+# Price fields written by the upserts, compared to skip unchanged documents
+PRICE_FIELDS = ("open", "high", "low", "close", "volume")
+
+# Operations per bulk_write call; large histories are split into batches of
+# this size instead of one huge request
+BULK_WRITE_BATCH_SIZE = 1000
+
+# (db_name, collection_name) pairs whose indexes were already ensured
+_indexed_collections = set()
+_index_lock = threading.Lock()
+
+
+def get_client(connection_string="mongodb://localhost:27017/"):
+    """
+    Return a cached MongoClient for the connection string, creating it on first use.
+
+    Callers share the client's connection pool and must not close it.
+
+    Args:
+        connection_string (str): MongoDB connection string
+
+    Returns:
+        pymongo.MongoClient: Client shared by every caller in the process
+    """
+    with _client_lock:
+        client = _client_cache.get(connection_string)
+        if client is None:
+            client = MongoClient(
+                connection_string,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                retryWrites=True,
+                compressors=MONGO_COMPRESSORS
+            )
+            _client_cache[connection_string] = client
+        return client
+
+
+def setup_logging(level=logging.INFO):
+    """
+    Configure root logging for a command-line entry point.
+
+    Records are formatted by the calling thread and handed to a queue; a
+    background listener writes them to stderr, so worker threads saving data
+    never block on console I/O. Scripts call this from main(); library code
+    only creates module loggers. Does nothing if the root logger already has
+    handlers.
+
+    Args:
+        level (int): Root logging level
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(level=level,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        handlers=[logging.handlers.QueueHandler(log_queue)])
+
+
+@atexit.register
+def _close_clients():
+    """Close the shared clients once, when the process exits."""
+    with _client_lock:
+        for client in _client_cache.values():
+            client.close()
+        _client_cache.clear()
+
+
 def connect_to_mongodb(connection_string="mongodb://localhost:27017/", db_name="finhisaab"):
     """
     Connect to MongoDB and return database object
@@ -25,9 +134,9 @@ def connect_to_mongodb(connection_string="mongodb://localhost:27017/", db_name="
         pymongo.database.Database: MongoDB database object
     """
     try:
-        client = MongoClient(connection_string)
+        client = get_client(connection_string)
         db = client[db_name]
-        logger.info(f"Successfully connected to MongoDB database: {db_name}")
+        logger.debug(f"Using MongoDB database: {db_name}")
         return db
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {str(e)}")
@@ -51,48 +160,306 @@ def dataframe_to_documents(df, symbol):
     # Reset index to make the Date column accessible
     df_reset = df.reset_index()
 
-    documents = []
-    for _, row in df_reset.iterrows():
-        # Convert pandas Timestamp to datetime if needed
-        date = row['Date']
-        if hasattr(date, 'to_pydatetime'):
-            date = date.to_pydatetime()
+    # Work on whole columns instead of boxing every row into a Series via
+    # iterrows(). Dates are converted in one pass.
+    dates = pd.DatetimeIndex(pd.to_datetime(df_reset['Date'])).to_pydatetime()
 
-        document = {
+    # Cast all numeric columns to float64 in a single step, then store prices
+    # as integer paisa. np.rint rounds half to even exactly like round().
+    prices = df_reset[['Open', 'High', 'Low', 'Close', 'Volume']].astype('float64').to_numpy()
+    if np.isnan(prices[:, :4]).any():
+        raise ValueError(f"Missing price values for symbol {symbol}")
+    paisa = np.rint(prices[:, :4] * 100).astype(np.int64)
+    opens, highs, lows, closes = (paisa[:, i].tolist() for i in range(4))
+    volumes = prices[:, 4].tolist()
+
+    documents = [
+        {
             "symbol": symbol,
             "date": date,
-            "open": int(round(float(row['Open']) * 100)),
-            "high": int(round(float(row['High']) * 100)),
-            "low": int(round(float(row['Low']) * 100)),
-            "close": int(round(float(row['Close']) * 100)),
-            "volume": float(row['Volume'])
+            "open": o,
+            "high": h,
+            "low": l,
+            "close": c,
+            "volume": v
         }
-        documents.append(document)
+        for date, o, h, l, c, v in zip(dates, opens, highs, lows, closes, volumes)
+    ]
 
     logger.info(f"Converted {len(documents)} rows of data for symbol {symbol}")
     return documents
 
+def ensure_indexes(db, collection_name="psxstockpricedata"):
+    """
+    Create the unique (symbol, date) index on a price collection.
+
+    Meant to be called once at startup. Repeat calls for the same collection
+    in the same process are no-ops, so save_to_mongodb() can call it without
+    paying a round-trip per symbol.
+
+    Args:
+        db (pymongo.database.Database): MongoDB database object
+        collection_name (str): Name of the price collection
+    """
+    key = (db.name, collection_name)
+    with _index_lock:
+        if key in _indexed_collections:
+            return
+        # Existing deployments already have this index under the default
+        # name, so don't pass a custom one (it would conflict). MongoDB walks
+        # it backwards for date-descending sorts, so "latest N bars" queries
+        # need no separate (symbol, date DESC) index.
+        db[collection_name].create_index(
+            [("symbol", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
+            unique=True,
+            background=True
+        )
+        _indexed_collections.add(key)
+        logger.info(f"Indexes ensured on {db.name}.{collection_name}")
+
+def ensure_stock_indexes(db, collection_name="stocks"):
+    """
+    Create the marketCap index used to list stocks largest first, and a
+    symbol index if the collection has none.
+
+    Every script pages through the stocks collection sorted by marketCap
+    descending; without this index each listing is a collection scan plus an
+    in-memory sort. _id is the tiebreaker for keyset pagination, resuming a
+    listing after the last (marketCap, _id) seen. symbol is included so
+    listings that project only symbol, marketCap and _id are covered queries,
+    answered from the index without fetching any stock document. Repeat
+    calls in the same process are no-ops.
+
+    Args:
+        db (pymongo.database.Database): MongoDB database object
+        collection_name (str): Name of the stocks collection
+    """
+    key = (db.name, collection_name, "marketCap")
+    with _index_lock:
+        if key in _indexed_collections:
+            return
+        db[collection_name].create_index(
+            [("marketCap", pymongo.DESCENDING), ("_id", pymongo.ASCENDING),
+             ("symbol", pymongo.ASCENDING)],
+            name="mc_id_sym",
+            background=True
+        )
+        # Symbol lookups (sync_symbols, --query filters); reuse any index the
+        # application already keeps on symbol, e.g. a unique one
+        existing = db[collection_name].index_information().values()
+        if not any(index["key"][0][0] == "symbol" for index in existing):
+            db[collection_name].create_index([("symbol", pymongo.ASCENDING)], background=True)
+        _indexed_collections.add(key)
+        logger.info(f"Indexes ensured on {db.name}.{collection_name}")
+
+@functools.lru_cache(maxsize=1024)
+def date_to_datetime(day):
+    """
+    Midnight datetime for a date, the form dates are stored in MongoDB.
+
+    Cached because the same interval boundaries recur for every symbol in a run.
+
+    Args:
+        day (datetime.date): Date to convert
+
+    Returns:
+        datetime: day at 00:00
+    """
+    return datetime.combine(day, time.min)
+
+def query_plan_stages(cursor):
+    """
+    Describe the winning plan of a find cursor, e.g. "PROJECTION_COVERED > IXSCAN".
+
+    Useful as a one-off startup check that a query is served by an index
+    (IXSCAN) rather than a collection scan (COLLSCAN).
+
+    Args:
+        cursor (pymongo.cursor.Cursor): Unconsumed find cursor
+
+    Returns:
+        str: Plan stages from the root down, separated by " > "
+    """
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    # Servers using the slot-based engine nest the classic plan one level down
+    plan = plan.get("queryPlan", plan)
+    stages = []
+    while plan:
+        stages.append(plan.get("stage", "?"))
+        inputs = plan.get("inputStages") or []
+        plan = plan.get("inputStage") or (inputs[0] if inputs else None)
+    return " > ".join(stages)
+
+def bulk_upsert(collection, operations, batch_size=BULK_WRITE_BATCH_SIZE):
+    """
+    Run upsert operations in unordered batches of batch_size.
+
+    Unordered so the server keeps going past individual failures; the only
+    expected ones are duplicate-key races on the unique index, which are
+    dropped from the returned errors.
+
+    Args:
+        collection (pymongo.collection.Collection): Target collection
+        operations (list): pymongo write operations
+        batch_size (int): Number of operations sent per bulk_write call
+
+    Returns:
+        tuple: (upserted_count, modified_count, write_errors). The counts are
+        None when the collection uses an unacknowledged write concern.
+    """
+    upserted_count = 0
+    modified_count = 0
+    write_errors = []
+    # Validation can only be bypassed on acknowledged writes
+    acknowledged = collection.write_concern.acknowledged
+
+    for start in range(0, len(operations), batch_size):
+        batch = operations[start:start + batch_size]
+        try:
+            result = collection.bulk_write(
+                batch, ordered=False, bypass_document_validation=acknowledged
+            )
+            if acknowledged:
+                upserted_count += result.upserted_count
+                modified_count += result.modified_count
+        except BulkWriteError as bwe:
+            upserted_count += bwe.details.get('nUpserted', 0)
+            modified_count += bwe.details.get('nModified', 0)
+            write_errors.extend(
+                err for err in bwe.details.get('writeErrors', [])
+                if err.get('code') != DUPLICATE_KEY_ERROR
+            )
+
+    if not acknowledged:
+        return None, None, write_errors
+    return upserted_count, modified_count, write_errors
+
+def build_upsert_operations(documents):
+    """
+    Build one upsert per price document, matched on (symbol, date).
+
+    Documents may span several symbols, so callers can combine a whole batch
+    of symbols into a single bulk_upsert call.
+
+    Each operation is a pipeline update that only bumps updatedAt when a price
+    field actually changed, so re-saving identical data leaves the stored
+    document byte-for-byte the same and the server skips the write (no
+    journal or oplog entry, and it is not counted as modified).
+
+    Args:
+        documents (list): Documents from dataframe_to_documents
+
+    Returns:
+        list: pymongo.UpdateOne operations that overwrite the price fields
+    """
+    # Update stages are BSON-encoded once up front so pymongo copies the
+    # bytes instead of walking each dict again when building the batch.
+    current_time = datetime.now()
+    operations = []
+    for doc in documents:
+        prices = {field: doc[field] for field in PRICE_FIELDS}
+        unchanged = {"$and": [{"$eq": ["$" + field, value]} for field, value in prices.items()]}
+        stage = RawBSONDocument(bson.encode({
+            "$set": {
+                **prices,
+                "updatedAt": {"$cond": [unchanged, "$updatedAt", current_time]},
+                "createdAt": {"$ifNull": ["$createdAt", current_time]},
+            }
+        }))
+        operations.append(pymongo.UpdateOne(
+            {"symbol": doc["symbol"], "date": doc["date"]},
+            [stage],
+            upsert=True,
+        ))
+    return operations
+
+def _insert_documents(collection, documents, symbol):
+    """
+    Insert documents, letting the unique (symbol, date) index reject rows that
+    already exist.
+
+    Returns:
+        tuple: (success, message) where success is a boolean and message is a string
+    """
+    current_time = datetime.now()
+    for doc in documents:
+        doc["createdAt"] = current_time
+        doc["updatedAt"] = current_time
+
+    inserted_count = 0
+    write_errors = []
+    for start in range(0, len(documents), BULK_WRITE_BATCH_SIZE):
+        batch = documents[start:start + BULK_WRITE_BATCH_SIZE]
+        try:
+            result = collection.insert_many(batch, ordered=False)
+            inserted_count += len(result.inserted_ids)
+        except BulkWriteError as bwe:
+            inserted_count += bwe.details.get('nInserted', 0)
+            write_errors.extend(
+                err for err in bwe.details.get('writeErrors', [])
+                if err.get('code') != DUPLICATE_KEY_ERROR
+            )
+
+    if not collection.write_concern.acknowledged:
+        return True, f"Submitted {len(documents)} documents for {symbol} (unacknowledged)"
+    if write_errors:
+        logger.error(
+            f"MongoDB insert for {symbol} had {len(write_errors)} failed writes: "
+            f"{write_errors[0].get('errmsg')}"
+        )
+        return False, (
+            f"Failed to write {len(write_errors)} of {len(documents)} "
+            f"documents for {symbol}"
+        )
+
+    skipped_count = len(documents) - inserted_count
+    logger.info(
+        f"MongoDB insert completed for {symbol}: "
+        f"{inserted_count} inserted, {skipped_count} already present"
+    )
+    return True, (
+        f"Successfully processed {len(documents)} documents for {symbol} "
+        f"({inserted_count} new, {skipped_count} skipped)"
+    )
+
 def save_to_mongodb(df, symbol, connection_string="mongodb://localhost:27017/",
-                   db_name="finhisaab", collection_name="psxstockpricedata"):
+                   db_name="finhisaab", collection_name="psxstockpricedata",
+                   collection=None, mode="upsert", write_concern=None):
     """
     Save stock data to MongoDB using an upsert strategy.
     If a record with the same (symbol, date) already exists it is updated with
     the latest scraped values; otherwise a new document is inserted.
 
+    With mode="append" the documents are inserted instead and rows whose
+    (symbol, date) already exists are skipped without being updated. This is
+    much cheaper for historical backfills where nearly every row is new.
+
     Args:
         df (pandas.DataFrame): DataFrame containing stock data
         symbol (str): Stock symbol
         connection_string (str): MongoDB connection string
         db_name (str): Name of the database
         collection_name (str): Name of the collection
+        collection (pymongo.collection.Collection, optional): Preconnected
+            collection; when given, connection_string/db_name/collection_name
+            are ignored
+        mode (str): "upsert" (default) to update existing rows, or "append"
+            to only insert new ones
+        write_concern (pymongo.WriteConcern, optional): Write concern for this
+            save. Backfills can pass WriteConcern(w=0) to skip waiting for
+            server acknowledgement; write errors (including duplicates) are
+            then not reported and have to be checked with a follow-up count.
 
     Returns:
         tuple: (success, message) where success is a boolean and message is a string
     """
     try:
         # Connect to MongoDB
-        db = connect_to_mongodb(connection_string, db_name)
-        collection = db[collection_name]
+        if collection is None:
+            db = connect_to_mongodb(connection_string, db_name)
+            collection = db[collection_name]
+        if write_concern is not None:
+            collection = collection.with_options(write_concern=write_concern)
 
         # Convert DataFrame to documents
         documents = dataframe_to_documents(df, symbol)
@@ -100,37 +467,28 @@ def save_to_mongodb(df, symbol, connection_string="mongodb://localhost:27017/",
         if not documents:
             return False, "No documents to insert"
 
-        # Ensure a unique index on (symbol, date).
-        # Upserts (UpdateOne) work fine with unique indexes — only raw InsertOne
-        # operations raise duplicate-key errors, which we no longer use.
-        collection.create_index(
-            [("symbol", pymongo.ASCENDING), ("date", pymongo.ASCENDING)],
-            unique=True
-        )
+        # Ensure a unique index on (symbol, date); no-op after the first call
+        ensure_indexes(collection.database, collection.name)
 
-        # Build upsert operations — match on (symbol, date), overwrite all fields
-        current_time = datetime.now()
-        operations = []
-        for doc in documents:
-            filter_keys = {"symbol": doc["symbol"], "date": doc["date"]}
-            update_fields = {k: v for k, v in doc.items() if k not in ("symbol", "date")}
-            update_fields["updatedAt"] = current_time
-            set_on_insert = {"createdAt": current_time}
-
-            operations.append(
-                pymongo.UpdateOne(
-                    filter_keys,
-                    {
-                        "$set": update_fields,
-                        "$setOnInsert": set_on_insert,
-                    },
-                    upsert=True,
-                )
-            )
+        if mode == "append":
+            return _insert_documents(collection, documents, symbol)
+        if mode != "upsert":
+            return False, f"Unknown save mode: {mode}"
+
+        operations = build_upsert_operations(documents)
 
-        result = collection.bulk_write(operations, ordered=False)
-        inserted_count = result.upserted_count
-        updated_count = result.modified_count
+        inserted_count, updated_count, write_errors = bulk_upsert(collection, operations)
+        if inserted_count is None:
+            return True, f"Submitted {len(operations)} upserts for {symbol} (unacknowledged)"
+        if write_errors:
+            logger.error(
+                f"MongoDB upsert for {symbol} had {len(write_errors)} failed writes: "
+                f"{write_errors[0].get('errmsg')}"
+            )
+            return False, (
+                f"Failed to write {len(write_errors)} of {len(documents)} "
+                f"documents for {symbol}"
+            )
 
         logger.info(
             f"MongoDB upsert completed for {symbol}: "
@@ -146,3 +504,28 @@ def save_to_mongodb(df, symbol, connection_string="mongodb://localhost:27017/",
         error_msg = f"Error saving data to MongoDB: {str(e)}"
         logger.error(error_msg)
         return False, error_msg
+
+def get_latest_prices(symbol, limit=1, connection_string="mongodb://localhost:27017/",
+                      db_name="finhisaab", collection_name="psxstockpricedata"):
+    """
+    Fetch the most recent price documents for a symbol, newest first.
+
+    Served by a backward scan of the (symbol, date) index that stops after
+    `limit` entries, and only the OHLCV fields are returned.
+
+    Args:
+        symbol (str): Stock symbol
+        limit (int): Number of most recent bars to return
+        connection_string (str): MongoDB connection string
+        db_name (str): Name of the database
+        collection_name (str): Name of the collection
+
+    Returns:
+        list: List of price documents without _id
+    """
+    db = connect_to_mongodb(connection_string, db_name)
+    cursor = db[collection_name].find(
+        {"symbol": symbol},
+        {"_id": 0, "date": 1, "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1}
+    ).sort("date", pymongo.DESCENDING).limit(limit)
+    return list(cursor)
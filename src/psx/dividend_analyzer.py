@@ -5,13 +5,41 @@ This script tests the AJAX endpoint to understand its structure before building
 
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pprint import pprint
+from psx.dividend_scraper import DATE_PROBES
+
+# Prefer orjson for decoding responses when it is installed
+try:
+    from orjson import loads as json_loads  # type: ignore
+except ImportError:
+    from json import loads as json_loads
 
 # Endpoint configuration
 ENDPOINT_URL = "https://www.scstrade.com/MarketStatistics/MS_xDates.aspx/chartact"
 REFERER_URL = "https://www.scstrade.com/MarketStatistics/MS_xDates.aspx"
 
+# Standard headers for AJAX requests
+HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Referer": REFERER_URL,
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "X-Requested-With": "XMLHttpRequest"
+}
+
+# Shared keep-alive session for every probe; retries transient connection
+# failures (the endpoint is read-only, so retrying POST is safe)
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, allowed_methods=None)
+))
 
 def analyze_endpoint():
     """
@@ -23,15 +51,6 @@ def analyze_endpoint():
     print("=" * 80)
     print(f"Endpoint: {ENDPOINT_URL}\n")
 
-    # Standard headers for AJAX requests
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Referer": REFERER_URL,
-        "Accept": "application/json, text/javascript, */*; q=0.01",
-        "X-Requested-With": "XMLHttpRequest"
-    }
-
     # Test different payload formats
     # Based on jqGrid config: postData: {'par': par} with serializeGridData: JSON.stringify
     payloads_to_test = [
@@ -47,16 +66,24 @@ def analyze_endpoint():
         {"par": "OGDC"},
     ]
 
-    for i, payload in enumerate(payloads_to_test, 1):
-        print(f"\n--- Test {i}: Payload = {payload} ---")
-        try:
-            response = requests.post(ENDPOINT_URL, json=payload, headers=headers, timeout=10)
+    # Fire all probes at once so the round-trips overlap, but inspect the
+    # results in list order so the first working format still wins
+    with ThreadPoolExecutor(max_workers=len(payloads_to_test)) as executor:
+        futures = [executor.submit(_post, payload) for payload in payloads_to_test]
+
+        for i, (payload, future) in enumerate(zip(payloads_to_test, futures), 1):
+            print(f"\n--- Test {i}: Payload = {payload} ---")
+            response, error = future.result()
+            if error is not None:
+                print(f"Request failed: {error}")
+                continue
+
             print(f"Status Code: {response.status_code}")
             print(f"Response Headers: {dict(response.headers)}\n")
 
             if response.status_code == 200:
                 try:
-                    data = response.json()
+                    data = json_loads(response.content)
                     print("Response JSON structure:")
                     print(f"Keys: {list(data.keys())}")
 
@@ -83,6 +110,8 @@ def analyze_endpoint():
                     # Success - use this payload format
                     if response.status_code == 200 and data:
                         print(f"\n✓ Payload format {i} SUCCESSFUL")
+                        for pending in futures:
+                            pending.cancel()
                         return payload, data
 
                 except json.JSONDecodeError as e:
@@ -91,64 +120,108 @@ def analyze_endpoint():
             else:
                 print(f"Error response: {response.text[:500]}")
 
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-
     return None, None
 
 
-def test_pagination(working_payload, rows_per_page=100):
+def _post(payload):
+    """
+    POST a payload to the endpoint. Returns (response, error) so it can run in a worker thread.
+    """
+    try:
+        return _SESSION.post(ENDPOINT_URL, json=payload, timeout=10), None
+    except requests.exceptions.RequestException as e:
+        return None, e
+
+
+def _fetch_page(working_payload, page_num, rows_per_page):
+    """
+    POST a single page request. Returns (response, error) so it can run in a worker thread.
+    """
+    payload = working_payload.copy()
+    payload['page'] = page_num
+    payload['rows'] = rows_per_page
+    return _post(payload)
+
+
+def _print_page(page_num, response, error):
+    """
+    Print a page result. Returns (keep_going, total_pages) where total_pages is
+    taken from a jqGrid response if present.
+    """
+    print(f"\n--- Page {page_num} ---")
+    if error is not None:
+        print(f"Request failed: {error}")
+        return True, None
+
+    try:
+        if response.status_code == 200:
+            data = json_loads(response.content)
+
+            # Handle ASP.NET format
+            records = data.get('d', data)
+
+            if isinstance(records, list):
+                print(f"Records on page {page_num}: {len(records)}")
+                if len(records) > 0:
+                    print(f"First record: {records[0]}")
+                else:
+                    print("No more records - reached end of data")
+                    return False, None
+            elif isinstance(records, dict):
+                # jqGrid format with total, page, records, rows
+                if 'rows' in records:
+                    print(f"Total records: {records.get('records', 'N/A')}")
+                    print(f"Total pages: {records.get('total', 'N/A')}")
+                    print(f"Current page: {records.get('page', 'N/A')}")
+                    print(f"Records on this page: {len(records['rows'])}")
+                    if records['rows']:
+                        print(f"First record: {records['rows'][0]}")
+                    try:
+                        return True, int(records.get('total'))
+                    except (TypeError, ValueError):
+                        pass
+        else:
+            print(f"Error: Status {response.status_code}")
+
+    except Exception as e:
+        print(f"Request failed: {e}")
+
+    return True, None
+
+
+def test_pagination(working_payload, rows_per_page=100, max_pages=3):
     """
     Test pagination with different page numbers.
+
+    The first page is fetched on its own; if it reports the total page count
+    only the pages that exist are requested. The remaining pages are fetched
+    concurrently over one keep-alive session.
     """
     print("\n" + "=" * 80)
     print("TESTING PAGINATION")
     print("=" * 80)
 
-    headers = {
-        "Content-Type": "application/json",
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-        "Referer": REFERER_URL,
-        "Accept": "application/json, text/javascript, */*; q=0.01",
-        "X-Requested-With": "XMLHttpRequest"
-    }
-
-    # Test first 3 pages
-    for page_num in range(1, 4):
-        payload = working_payload.copy()
-        payload['page'] = page_num
-        payload['rows'] = rows_per_page
-
-        print(f"\n--- Page {page_num} ---")
-        try:
-            response = requests.post(ENDPOINT_URL, json=payload, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
+    keep_going, total_pages = _print_page(
+        1, *_fetch_page(working_payload, 1, rows_per_page)
+    )
+    if not keep_going:
+        return
 
-                # Handle ASP.NET format
-                records = data.get('d', data)
+    last_page = min(max_pages, total_pages) if total_pages else max_pages
+    pages = list(range(2, last_page + 1))
+    if not pages:
+        return
 
-                if isinstance(records, list):
-                    print(f"Records on page {page_num}: {len(records)}")
-                    if len(records) > 0:
-                        print(f"First record: {records[0]}")
-                    else:
-                        print("No more records - reached end of data")
-                        break
-                elif isinstance(records, dict):
-                    # jqGrid format with total, page, records, rows
-                    if 'rows' in records:
-                        print(f"Total records: {records.get('records', 'N/A')}")
-                        print(f"Total pages: {records.get('total', 'N/A')}")
-                        print(f"Current page: {records.get('page', 'N/A')}")
-                        print(f"Records on this page: {len(records['rows'])}")
-                        if records['rows']:
-                            print(f"First record: {records['rows'][0]}")
-            else:
-                print(f"Error: Status {response.status_code}")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda page_num: _fetch_page(working_payload, page_num, rows_per_page),
+            pages
+        ))
 
-        except Exception as e:
-            print(f"Request failed: {e}")
+    for page_num, (response, error) in zip(pages, results):
+        keep_going, _ = _print_page(page_num, response, error)
+        if not keep_going:
+            break
 
 
 def parse_response(response_data):
@@ -206,22 +279,16 @@ def test_date_parsing(sample_dates):
     print("TESTING DATE PARSING")
     print("=" * 80)
 
-    date_formats = [
-        "%d %b %Y",      # 15 Jan 2025
-        "%d-%b-%Y",      # 15-Jan-2025
-        "%d/%m/%Y",      # 15/01/2025
-        "%Y-%m-%d",      # 2025-01-15
-        "%B %d, %Y",     # January 15, 2025
-        "%d %B %Y",      # 15 January 2025
-    ]
-
     for date_str in sample_dates:
         print(f"\nTesting: '{date_str}'")
         parsed = False
+        date_str = date_str.strip()
 
-        for fmt in date_formats:
+        for pattern, fmt in DATE_PROBES:
+            if not pattern.match(date_str):
+                continue
             try:
-                dt = datetime.strptime(date_str.strip(), fmt)
+                dt = datetime.strptime(date_str, fmt)
                 print(f"  ✓ Matched format: {fmt} → {dt}")
                 parsed = True
                 break
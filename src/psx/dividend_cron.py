@@ -5,8 +5,9 @@ This script runs as a standalone job, separate from the price data scraper.
 
 from psx.dividend_scraper import DividendScraper
 from psx.dividend_store import save_announcements_to_mongodb, get_collection_stats
+from psx.data_store import setup_logging
+from psx.mongodb_helpers import test_mongo_connectivity
 import os
-from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 
 # Load environment variables from a .env file if python-dotenv is available
@@ -17,54 +18,43 @@ except Exception:
     pass
 
 
-def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
+def config_from_env() -> dict:
     """
-    Perform a quick connectivity test to MongoDB.
+    Build the cron configuration from environment variables.
 
-    Attempts to connect and run a simple ping command. Returns True if
-    successful, False otherwise.
-
-    Args:
-        connection_string: MongoDB connection string
-        db_name: Database name
+    Provides sensible defaults for local development.
 
     Returns:
-        bool: True if connectivity test passed, False otherwise
+        dict: connection_string, db_name, dividend_collection_name and
+        bonus_collection_name
     """
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        # Run a simple admin ping to verify connectivity
-        client.admin.command('ping')
-        # Optionally touch the target DB to ensure we can access it
-        _ = client[db_name].name
-        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
-        return True
-    except Exception as e:
-        print(f"MongoDB connectivity check FAILED: {e}")
-        return False
-    finally:
-        try:
-            if 'client' in locals():
-                client.close()
-        except Exception:
-            pass
+    return {
+        "connection_string": os.getenv("FINHISAAB_PRIMARY_DB_MONGO_URI", "mongodb://192.168.0.131:27017/"),
+        "db_name": os.getenv("FINHISAAB_PRIMARY_DB_NAME", "finhisaab"),
+        "dividend_collection_name": os.getenv("FINHISAAB_DIVIDEND_COLLECTION", "dividendannouncements"),
+        "bonus_collection_name": os.getenv("FINHISAAB_BONUS_COLLECTION", "bonusannouncements"),
+    }
 
 
-def main():
+def run(config: dict):
     """
-    Main function for the dividend announcements cron job.
+    Scrape announcements once and store them using the given configuration.
+
+    Other entry points should call this with their own collection layout
+    rather than copying the scrape/save steps.
+
+    Args:
+        config: Dictionary in the shape returned by config_from_env()
     """
     print("=" * 80)
     print("PSX DIVIDEND ANNOUNCEMENTS - CRON JOB")
     print("=" * 80)
     print(f"Started at: {__import__('datetime').datetime.now()}\n")
 
-    # MongoDB connection settings via environment variables
-    # Provide sensible defaults for local development
-    connection_string = os.getenv("FINHISAAB_PRIMARY_DB_MONGO_URI", "mongodb://192.168.0.131:27017/")
-    db_name = os.getenv("FINHISAAB_PRIMARY_DB_NAME", "finhisaab")
-    dividend_collection_name = os.getenv("FINHISAAB_DIVIDEND_COLLECTION", "dividendannouncements")
-    bonus_collection_name = os.getenv("FINHISAAB_BONUS_COLLECTION", "bonusannouncements")
+    connection_string = config["connection_string"]
+    db_name = config["db_name"]
+    dividend_collection_name = config["dividend_collection_name"]
+    bonus_collection_name = config["bonus_collection_name"]
 
     # Early connectivity test to fail fast if DB is unreachable
     if not test_mongo_connectivity(connection_string, db_name):
@@ -94,13 +84,11 @@ def main():
 
         print(f"✓ Successfully fetched {len(announcements)} announcements")
 
-        # Print summary
-        dividend_count = announcements['announcement_type'].apply(
-            lambda x: 'dividend' in x).sum()
-        bonus_count = announcements['announcement_type'].apply(
-            lambda x: 'bonus' in x).sum()
-        rights_count = announcements['announcement_type'].apply(
-            lambda x: 'right' in x).sum()
+        # Print summary (announcement_type holds a list of types per row)
+        type_counts = announcements['announcement_type'].explode().value_counts()
+        dividend_count = int(type_counts.get('dividend', 0))
+        bonus_count = int(type_counts.get('bonus', 0))
+        rights_count = int(type_counts.get('right', 0))
 
         print(f"\nAnnouncement breakdown:")
         print(f"  Dividend: {dividend_count}")
@@ -174,6 +162,14 @@ def main():
     print("=" * 80)
 
 
+def main():
+    """
+    Main function for the dividend announcements cron job.
+    """
+    setup_logging()
+    run(config_from_env())
+
+
 if __name__ == "__main__":
     main()
 
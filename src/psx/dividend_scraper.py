@@ -5,17 +5,67 @@ Scrapes dividend, bonus, and rights announcements from scstrade.com.
 
 import requests
 import pandas as pd
+import os
+import re
+import gzip
+import json
 import threading
 import logging
+from pathlib import Path
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, List, Dict
 import time
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Prefer orjson for decoding responses when it is installed
+try:
+    from orjson import loads as json_loads  # type: ignore
+except ImportError:
+    from json import loads as json_loads
+
 logger = logging.getLogger(__name__)
 
+# Ex-date formats seen on scstrade.com, most common first, each with a regex
+# that picks it out so only the matching format is handed to strptime
+DATE_PROBES = [
+    (re.compile(r"^\d{1,2} [A-Za-z]{3} \d{4}$"), "%d %b %Y"),        # 20 Apr 2026
+    (re.compile(r"^\d{1,2}-[A-Za-z]{3}-\d{4}$"), "%d-%b-%Y"),        # 20-Apr-2026
+    (re.compile(r"^\d{1,2}/\d{1,2}/\d{4}$"), "%d/%m/%Y"),           # 20/04/2026
+    (re.compile(r"^\d{4}-\d{1,2}-\d{1,2}$"), "%Y-%m-%d"),           # 2026-04-20
+    (re.compile(r"^[A-Za-z]+ \d{1,2}, \d{4}$"), "%B %d, %Y"),       # April 20, 2026
+    (re.compile(r"^\d{1,2} [A-Za-z]{4,} \d{4}$"), "%d %B %Y"),       # 20 April 2026
+]
+
+# Conditional-request validators and bodies persisted across runs
+CACHE_PATH = Path.home() / ".cache" / "psx" / "xdates.json.gz"
+
+# Raw record keys, in the order _extract_announcement unpacks them
+RECORD_FIELDS = (
+    'company_code',     # symbol
+    'company_name',     # name
+    'bm_dividend',      # dividend
+    'bm_bonus',         # bonus
+    'bm_right_per',     # right
+    'bm_bc_exp',        # x_date
+    'sector_name',      # sector
+)
+_get_record_fields = itemgetter(*RECORD_FIELDS)
+
+# Drops '%' and whitespace from percentage strings in a single pass
+_PERCENT_TRANS = str.maketrans('', '', '% \t\n\r')
+
+
+def _record_fields(record: Dict) -> List[str]:
+    """
+    Return the stripped RECORD_FIELDS values of a raw record, '' when missing.
+    """
+    try:
+        values = _get_record_fields(record)
+    except KeyError:
+        values = [record.get(field, '') for field in RECORD_FIELDS]
+    return [value.strip() for value in values]
+
 
 class DividendScraper:
     """
@@ -25,13 +75,70 @@ class DividendScraper:
     loadonce=true (all data loaded in single request).
     """
 
-    def __init__(self):
-        """Initialize the scraper with endpoint configuration."""
+    def __init__(self, cache_path: Optional[Path] = CACHE_PATH):
+        """
+        Initialize the scraper with endpoint configuration.
+
+        Args:
+            cache_path: File used to keep response validators and bodies
+                between runs, or None to cache in memory only
+        """
         self.__endpoint = "https://www.scstrade.com/MarketStatistics/MS_xDates.aspx/chartact"
         self.__referer = "https://www.scstrade.com/MarketStatistics/MS_xDates.aspx"
         self.__local = threading.local()
+        # (etag, last_modified, data) of the last full response per 'par'
+        # value, for conditional requests
+        self.__cache_path = Path(cache_path) if cache_path else None
+        self.__cache_lock = threading.Lock()
+        self.__response_cache = self._load_cache()
+        # Set when a revalidatable response was cached since the last save
+        self.__cache_dirty = False
         logger.info("DividendScraper initialized")
 
+    def _load_cache(self) -> Dict:
+        """
+        Load cached responses for this endpoint from disk.
+
+        Returns:
+            Dict: 'par' → (etag, last_modified, data), empty if unavailable
+        """
+        if not self.__cache_path or not self.__cache_path.exists():
+            return {}
+
+        try:
+            with gzip.open(self.__cache_path, 'rb') as f:
+                cache = json_loads(f.read())
+            return {
+                par: tuple(entry)
+                for par, entry in cache.get(self.__endpoint, {}).items()
+            }
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable response cache: {str(e)}")
+            return {}
+
+    def _save_cache(self):
+        """
+        Write cached responses to disk, replacing the file atomically.
+
+        Called once at the end of each fetch; does nothing if no new
+        response with an ETag or Last-Modified header was cached.
+        """
+        if not self.__cache_path:
+            return
+
+        try:
+            with self.__cache_lock:
+                if not self.__cache_dirty:
+                    return
+                self.__cache_dirty = False
+                self.__cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.__cache_path.with_suffix('.tmp')
+                with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                    json.dump({self.__endpoint: dict(self.__response_cache)}, f)
+                os.replace(tmp_path, self.__cache_path)
+        except Exception as e:
+            logger.warning(f"Could not save response cache: {str(e)}")
+
     @property
     def session(self):
         """
@@ -57,20 +164,19 @@ class DividendScraper:
         try:
             # Make request
             response_data = self._make_request()
+            self._save_cache()
 
             if not response_data:
                 logger.warning("No data received from endpoint")
                 return pd.DataFrame()
 
-            # Parse records
-            records = self._parse_records(response_data)
+            # Parse records into a DataFrame
+            df = self._parse_frame(response_data)
 
-            if not records:
+            if df.empty:
                 logger.warning("No records parsed from response")
-                return pd.DataFrame()
+                return df
 
-            # Convert to DataFrame
-            df = pd.DataFrame(records)
             logger.info(f"Successfully fetched {len(df)} announcements")
 
             return df
@@ -79,10 +185,44 @@ class DividendScraper:
             logger.error(f"Error fetching announcements: {str(e)}", exc_info=True)
             raise
 
-    def _make_request(self) -> Optional[Dict]:
+    def fetch_many(self, pars: List[str], max_workers: int = 8) -> List[pd.DataFrame]:
+        """
+        Fetch announcements for several 'par' filter values concurrently.
+
+        Each worker thread uses its own session (see the session property).
+
+        Args:
+            pars: Values for the endpoint's 'par' parameter
+            max_workers: Maximum number of concurrent requests
+
+        Returns:
+            List[pd.DataFrame]: One DataFrame per 'par', in the same order
+                (empty if that request failed)
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(self._fetch_par, pars))
+        finally:
+            # One write for the whole batch rather than one per response
+            self._save_cache()
+
+    def _fetch_par(self, par: str) -> pd.DataFrame:
+        """
+        Fetch and parse announcements for a single 'par' value.
+        """
+        response_data = self._make_request(par)
+        if not response_data:
+            logger.warning(f"No data received for par '{par}'")
+            return pd.DataFrame()
+        return self._parse_frame(response_data)
+
+    def _make_request(self, par: str = "") -> Optional[Dict]:
         """
         Make POST request to the AJAX endpoint.
 
+        Args:
+            par: Filter parameter; empty string gets all records
+
         Returns:
             Optional[Dict]: JSON response or None if failed
         """
@@ -91,11 +231,22 @@ class DividendScraper:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Referer": self.__referer,
             "Accept": "application/json, text/javascript, */*; q=0.01",
-            "X-Requested-With": "XMLHttpRequest"
+            "X-Requested-With": "XMLHttpRequest",
+            "Accept-Encoding": "gzip, deflate"
         }
 
+        # Ask the server to skip the body if nothing changed since the last fetch
+        with self.__cache_lock:
+            cached = self.__response_cache.get(par)
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
         # Payload: empty 'par' parameter gets all records
-        payload = {"par": ""}
+        payload = {"par": par}
 
         try:
             logger.debug(f"Making POST request to {self.__endpoint}")
@@ -106,11 +257,24 @@ class DividendScraper:
                 timeout=30
             )
 
+            if response.status_code == 304 and cached:
+                logger.info("Announcements not modified since last fetch, using cached data")
+                return cached[2]
+
             response.raise_for_status()
 
-            data = response.json()
+            data = json_loads(response.content)
             logger.debug(f"Received response with status {response.status_code}")
 
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            with self.__cache_lock:
+                self.__response_cache[par] = (etag, last_modified, data)
+                # Only worth persisting if the server gave us something to
+                # revalidate; the fetch methods save once when they finish
+                if etag or last_modified:
+                    self.__cache_dirty = True
+
             return data
 
         except requests.exceptions.RequestException as e:
@@ -130,27 +294,101 @@ class DividendScraper:
         Returns:
             List[Dict]: List of parsed announcement records
         """
+        return self._parse_frame(response_data).to_dict('records')
+
+    def _parse_frame(self, response_data: Dict) -> pd.DataFrame:
+        """
+        Parse records from ASP.NET JSON response into a DataFrame.
+
+        Fields are extracted per record, but ex-dates are parsed for the
+        whole column at once with pd.to_datetime. The fetch methods use this
+        directly; _parse_records returns the same rows as a list of dicts.
+
+        Args:
+            response_data: Response JSON (ASP.NET format with 'd' key)
+
+        Returns:
+            pd.DataFrame: Parsed announcement records
+        """
         # Handle ASP.NET format: {d: [...]}
         records = response_data.get('d', response_data)
 
         if not isinstance(records, list):
             logger.error(f"Expected list of records, got {type(records)}")
-            return []
+            return pd.DataFrame()
 
         logger.info(f"Parsing {len(records)} records...")
 
         parsed_records = []
         for i, record in enumerate(records):
             try:
-                parsed = self.parse_announcement(record)
+                parsed = self._extract_announcement(record)
                 if parsed:
                     parsed_records.append(parsed)
             except Exception as e:
                 logger.warning(f"Failed to parse record {i}: {str(e)}")
                 continue
 
-        logger.info(f"Successfully parsed {len(parsed_records)} records")
-        return parsed_records
+        if not parsed_records:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(parsed_records)
+        df['x_date'] = self.parse_dates(df['x_date'])
+        # One timestamp for the whole response rather than a call per record
+        df['scraped_at'] = datetime.now()
+
+        unparsed = df['x_date'].isna()
+        for symbol in df.loc[unparsed, 'symbol']:
+            logger.warning(f"Could not parse ex-date for {symbol}")
+        df = df[~unparsed].reset_index(drop=True)
+
+        logger.info(f"Successfully parsed {len(df)} records")
+        return df
+
+    def _extract_announcement(self, record: Dict) -> Optional[Dict]:
+        """
+        Extract the fields of a single announcement record.
+
+        The ex-date is returned as the raw string and no scraped_at is set;
+        see parse_announcement for a complete record.
+
+        Args:
+            record: Raw record from API
+
+        Returns:
+            Optional[Dict]: Extracted record or None if invalid
+        """
+        # Extract fields in one lookup
+        (symbol, name, dividend_str, bonus_str,
+         right_str, x_date_str, sector) = _record_fields(record)
+
+        # Skip if no symbol or no ex-date
+        if not symbol or not x_date_str:
+            return None
+
+        # Determine announcement types
+        announcement_types = []
+        if dividend_str:
+            announcement_types.append("dividend")
+        if bonus_str:
+            announcement_types.append("bonus")
+        if right_str:
+            announcement_types.append("right")
+
+        # Skip if no announcements
+        if not announcement_types:
+            return None
+
+        return {
+            "symbol": symbol,
+            "name": name,
+            "dividend": self._parse_percentage(dividend_str),
+            "bonus": bonus_str,
+            "right": right_str,
+            "x_date": x_date_str,
+            "sector": sector,
+            "announcement_type": announcement_types
+        }
 
     def parse_announcement(self, record: Dict) -> Optional[Dict]:
         """
@@ -172,52 +410,19 @@ class DividendScraper:
             Optional[Dict]: Parsed record or None if invalid
         """
         try:
-            # Extract fields
-            symbol = record.get('company_code', '').strip()
-            name = record.get('company_name', '').strip()
-            dividend_str = record.get('bm_dividend', '').strip()
-            bonus_str = record.get('bm_bonus', '').strip()
-            right_str = record.get('bm_right_per', '').strip()
-            x_date_str = record.get('bm_bc_exp', '').strip()
-            sector = record.get('sector_name', '').strip()
-
-            # Skip if no symbol or no ex-date
-            if not symbol or not x_date_str:
+            parsed = self._extract_announcement(record)
+            if not parsed:
                 return None
 
             # Parse date
-            x_date = self.parse_date(x_date_str)
+            x_date = self.parse_date(parsed['x_date'])
             if not x_date:
-                logger.warning(f"Could not parse date '{x_date_str}' for {symbol}")
+                logger.warning(f"Could not parse date '{parsed['x_date']}' for {parsed['symbol']}")
                 return None
 
-            # Parse dividend percentage
-            dividend = self._parse_percentage(dividend_str)
-
-            # Determine announcement types
-            announcement_types = []
-            if dividend_str:
-                announcement_types.append("dividend")
-            if bonus_str:
-                announcement_types.append("bonus")
-            if right_str:
-                announcement_types.append("right")
-
-            # Skip if no announcements
-            if not announcement_types:
-                return None
-
-            return {
-                "symbol": symbol,
-                "name": name,
-                "dividend": dividend,
-                "bonus": bonus_str,
-                "right": right_str,
-                "x_date": x_date,
-                "sector": sector,
-                "announcement_type": announcement_types,
-                "scraped_at": datetime.now()
-            }
+            parsed['x_date'] = x_date
+            parsed['scraped_at'] = datetime.now()
+            return parsed
 
         except Exception as e:
             logger.warning(f"Error parsing record: {str(e)}")
@@ -239,25 +444,44 @@ class DividendScraper:
         if not date_string:
             return None
 
-        # Try multiple formats
-        formats = [
-            "%d %b %Y",      # 20 Apr 2026
-            "%d-%b-%Y",      # 20-Apr-2026
-            "%d/%m/%Y",      # 20/04/2026
-            "%Y-%m-%d",      # 2026-04-20
-            "%B %d, %Y",     # April 20, 2026
-            "%d %B %Y",      # 20 April 2026
-        ]
-
-        for fmt in formats:
-            try:
-                return datetime.strptime(date_string.strip(), fmt)
-            except ValueError:
-                continue
+        date_string = date_string.strip()
+
+        # Only parse with the format whose pattern matches
+        for probe, fmt in DATE_PROBES:
+            if probe.match(date_string):
+                try:
+                    return datetime.strptime(date_string, fmt)
+                except ValueError:
+                    break
 
         logger.warning(f"Could not parse date: '{date_string}'")
         return None
 
+    def parse_dates(self, date_strings: pd.Series) -> pd.Series:
+        """
+        Parse a column of date strings, each row with the format whose
+        DATE_PROBES pattern it matches.
+
+        Args:
+            date_strings: Series of date strings
+
+        Returns:
+            pd.Series: datetime64 Series with NaT where no format matched
+        """
+        date_strings = date_strings.astype(str).str.strip()
+        dates = pd.Series(pd.NaT, index=date_strings.index, dtype='datetime64[us]')
+        unmatched = pd.Series(True, index=date_strings.index)
+
+        for probe, fmt in DATE_PROBES:
+            if not unmatched.any():
+                break
+            matched = unmatched & date_strings.str.match(probe)
+            if matched.any():
+                dates[matched] = pd.to_datetime(date_strings[matched], format=fmt, errors='coerce')
+                unmatched &= ~matched
+
+        return dates
+
     def _parse_percentage(self, percent_str: str) -> float:
         """
         Parse percentage string to float.
@@ -268,12 +492,12 @@ class DividendScraper:
         Returns:
             float: Percentage value or 0.0 if invalid
         """
-        if not percent_str:
+        # Remove % sign and whitespace
+        clean_str = percent_str.translate(_PERCENT_TRANS) if percent_str else ''
+        if not clean_str:
             return 0.0
 
         try:
-            # Remove % sign and convert to float
-            clean_str = percent_str.replace('%', '').strip()
             return float(clean_str)
         except ValueError:
             logger.warning(f"Could not parse percentage: '{percent_str}'")
@@ -284,6 +508,8 @@ def main():
     """
     Test the scraper standalone.
     """
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     print("=" * 80)
     print("PSX DIVIDEND SCRAPER - STANDALONE TEST")
     print("=" * 80)
@@ -308,9 +534,10 @@ def main():
     print("=" * 80)
     print(f"Total announcements: {len(df)}")
     print(f"\nBy type:")
-    print(f"  Dividend: {df['announcement_type'].apply(lambda x: 'dividend' in x).sum()}")
-    print(f"  Bonus: {df['announcement_type'].apply(lambda x: 'bonus' in x).sum()}")
-    print(f"  Rights: {df['announcement_type'].apply(lambda x: 'right' in x).sum()}")
+    type_counts = df['announcement_type'].explode().value_counts()
+    print(f"  Dividend: {int(type_counts.get('dividend', 0))}")
+    print(f"  Bonus: {int(type_counts.get('bonus', 0))}")
+    print(f"  Rights: {int(type_counts.get('right', 0))}")
 
     print(f"\nDividend range: {df['dividend'].min():.2f}% - {df['dividend'].max():.2f}%")
     print(f"Date range: {df['x_date'].min()} to {df['x_date'].max()}")
@@ -4,20 +4,23 @@ Aligns with Mongoose schemas DividendAnnouncement and BonusAnnouncement.
 """
 
 import pymongo
-from pymongo import MongoClient
 import pandas as pd
 from datetime import datetime
+import threading
 import logging
+from psx.data_store import get_client
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# (connection_string, db_name, dividend_collection, bonus_collection) tuples
+# whose indexes were already created in this process
+_indexed_collections = set()
+_index_lock = threading.Lock()
+
 
 def connect_to_mongodb(connection_string, db_name):
     try:
-        client = MongoClient(connection_string)
+        client = get_client(connection_string)
         db = client[db_name]
         return db
     except Exception as e:
@@ -41,76 +44,115 @@ def create_indexes(db, dividend_collection_name, bonus_collection_name):
         bonus_coll.create_index([("status", pymongo.ASCENDING)], name="status_asc")
         
         logger.info("Successfully created indexes")
+        return True
 
     except Exception as e:
         logger.warning(f"Index creation warning (may already exist): {str(e)}")
+        return False
+
+
+def ensure_indexes(db, connection_string, db_name,
+                   dividend_collection_name, bonus_collection_name):
+    """
+    Create the announcement indexes once per process.
+
+    createIndex is a server round-trip even when the index already exists, so
+    repeated saves skip it after the first successful call.
+    """
+    key = (connection_string, db_name, dividend_collection_name, bonus_collection_name)
+    with _index_lock:
+        if key in _indexed_collections:
+            return
+        if create_indexes(db, dividend_collection_name, bonus_collection_name):
+            _indexed_collections.add(key)
+
+
+def insert_documents(collection, documents):
+    """
+    Insert documents in one unordered insert_many, skipping duplicates.
+
+    Returns:
+        int: Number of documents actually inserted, or submitted when the
+            collection uses an unacknowledged write concern
+    """
+    if not documents:
+        return 0
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        # Duplicates are not reported back for unacknowledged writes
+        return len(result.inserted_ids)
+    except pymongo.errors.BulkWriteError as bwe:
+        # Ignore duplicate key errors, count successful inserts
+        return bwe.details['nInserted']
 
 
 def process_announcements(announcements_df, face_values):
     if announcements_df.empty:
         return [], []
 
-    dividends = []
-    bonuses = []
-    
     now = datetime.now()
 
-    for _, row in announcements_df.iterrows():
-        # Get actual python datetime
-        x_date = row['x_date']
-        if hasattr(x_date, 'to_pydatetime'):
-            x_date = x_date.to_pydatetime()
-
-        symbol = row.get('symbol', '').strip()
-        if not symbol:
-            continue
-
-        base_metadata = {
-            "source": "scstrade",
-            "notes": f"Sector: {row.get('sector', '')}"
-        }
-
-        # Process Dividend
-        if "dividend" in row.get('announcement_type', []):
-            try:
-                percent_amount = float(row.get('dividend', 0))
-                if percent_amount > 0:
-                    face_value = face_values.get(symbol, 10.0) # default face value is 10.0
-                    actual_amount = (percent_amount * face_value) / 100.0
-                    
-                    dividends.append({
-                        "symbol": symbol,
-                        "amountPerShare": actual_amount,
-                        "faceValue": face_value,
-                        "exDate": x_date,
-                        "payDate": x_date, # PSX only gives xDate, use it for required payDate
-                        "status": "ANNOUNCED",
-                        "metadata": base_metadata,
-                        "createdAt": now,
-                        "updatedAt": now
-                    })
-            except Exception as e:
-                logger.warning(f"Could not parse dividend amount for {symbol}: {e}")
-
-        # Process Bonus
-        if "bonus" in row.get('announcement_type', []) and row.get('bonus'):
-            try:
-                bonus_str = str(row['bonus']).replace('%', '').strip()
-                if bonus_str:
-                    amount = float(bonus_str)
-                    if amount > 0:
-                        bonuses.append({
-                            "symbol": symbol,
-                            "bonusPercentage": amount,
-                            "bonusType": "BONUS_SHARES",
-                            "exDate": x_date,
-                            "status": "ANNOUNCED",
-                            "metadata": base_metadata,
-                            "createdAt": now,
-                            "updatedAt": now
-                        })
-            except Exception as e:
-                logger.warning(f"Could not parse bonus amount for {symbol}: {e}")
+    # Drop rows without a symbol or ex-date up front with vectorized masks,
+    # then split the survivors into dividend and bonus candidates
+    df = announcements_df.reindex(
+        columns=['symbol', 'x_date', 'sector', 'announcement_type', 'dividend', 'bonus'])
+    df['symbol'] = df['symbol'].fillna('').astype(str).str.strip()
+    df['sector'] = df['sector'].fillna('')
+    df['x_date'] = pd.to_datetime(df['x_date'])
+    df = df[(df['symbol'] != '') & df['x_date'].notna()].reset_index(drop=True)
+
+    types = df['announcement_type'].explode()
+
+    def has_type(name):
+        return (types == name).groupby(level=0).any().reindex(df.index, fill_value=False)
+
+    def objects(values, index):
+        # Object column, so to_dict() yields python datetimes, not Timestamps
+        return pd.Series(values, index=index, dtype=object)
+
+    def metadata(sectors):
+        return [{"source": "scstrade", "notes": f"Sector: {sector}"} for sector in sectors]
+
+    # Documents are built column-wise and converted with a single to_dict()
+
+    # Process Dividends
+    dividend_percent = pd.to_numeric(df['dividend'], errors='coerce').astype(float)
+    for symbol in df.loc[has_type('dividend') & dividend_percent.isna() & df['dividend'].notna(), 'symbol']:
+        logger.warning(f"Could not parse dividend amount for {symbol}")
+    div_df = df[has_type('dividend') & (dividend_percent > 0)]
+    face_value = div_df['symbol'].map(face_values).fillna(10.0) # default face value is 10.0
+    ex_dates = objects(pd.DatetimeIndex(div_df['x_date']).to_pydatetime(), div_df.index)
+
+    dividends = pd.DataFrame({
+        "symbol": div_df['symbol'],
+        "amountPerShare": (dividend_percent[div_df.index] * face_value) / 100.0,
+        "faceValue": face_value,
+        "exDate": ex_dates,
+        "payDate": ex_dates, # PSX only gives xDate, use it for required payDate
+        "status": "ANNOUNCED",
+        "metadata": metadata(div_df['sector']),
+        "createdAt": objects(now, div_df.index),
+        "updatedAt": objects(now, div_df.index)
+    }).to_dict(orient='records')
+
+    # Process Bonuses
+    bonus_df = df[has_type('bonus')]
+    bonus_str = bonus_df['bonus'].fillna('').astype(str).str.replace('%', '').str.strip()
+    bonus_percent = pd.to_numeric(bonus_str, errors='coerce').astype(float)
+    for symbol in bonus_df.loc[bonus_percent.isna() & (bonus_str != ''), 'symbol']:
+        logger.warning(f"Could not parse bonus amount for {symbol}")
+    bonus_df = bonus_df[bonus_percent > 0]
+
+    bonuses = pd.DataFrame({
+        "symbol": bonus_df['symbol'],
+        "bonusPercentage": bonus_percent[bonus_df.index],
+        "bonusType": "BONUS_SHARES",
+        "exDate": objects(pd.DatetimeIndex(bonus_df['x_date']).to_pydatetime(), bonus_df.index),
+        "status": "ANNOUNCED",
+        "metadata": metadata(bonus_df['sector']),
+        "createdAt": objects(now, bonus_df.index),
+        "updatedAt": objects(now, bonus_df.index)
+    }).to_dict(orient='records')
 
     logger.info(f"Parsed {len(dividends)} dividends and {len(bonuses)} bonuses")
     return dividends, bonuses
@@ -118,10 +160,15 @@ def process_announcements(announcements_df, face_values):
 
 def save_announcements_to_mongodb(df, connection_string, db_name, 
                                   dividend_collection_name, 
-                                  bonus_collection_name):
+                                  bonus_collection_name,
+                                  write_concern=None):
+    # write_concern (pymongo.WriteConcern, optional) applies to the inserts;
+    # rescrapes are idempotent thanks to the unique index, so cron runs can
+    # pass e.g. WriteConcern(w=1, j=False) to skip waiting on the journal
     try:
         db = connect_to_mongodb(connection_string, db_name)
-        create_indexes(db, dividend_collection_name, bonus_collection_name)
+        ensure_indexes(db, connection_string, db_name,
+                       dividend_collection_name, bonus_collection_name)
         
         # Fetch all stocks to get their faceValue
         stocks_collection = db['stocks']
@@ -139,8 +186,6 @@ def save_announcements_to_mongodb(df, connection_string, db_name,
         
         div_deleted = 0
         bonus_deleted = 0
-        div_inserted = 0
-        bonus_inserted = 0
 
         # Cleanup orphaned future announcements
         if not df.empty:
@@ -151,17 +196,16 @@ def save_announcements_to_mongodb(df, connection_string, db_name,
             future_divs = db[dividend_collection_name].find({
                 "exDate": {"$gte": today_start},
                 "metadata.source": "scstrade"
-            })
+            }, {'symbol': 1, 'exDate': 1})
             
-            div_delete_ops = []
-            for doc in future_divs:
-                key = (doc.get('symbol'), doc.get('exDate'))
-                if key not in incoming_div_keys:
-                    div_delete_ops.append(pymongo.DeleteOne({'_id': doc['_id']}))
+            div_delete_ids = [
+                doc['_id'] for doc in future_divs
+                if (doc.get('symbol'), doc.get('exDate')) not in incoming_div_keys
+            ]
                     
-            if div_delete_ops:
+            if div_delete_ids:
                 try:
-                    res = db[dividend_collection_name].bulk_write(div_delete_ops, ordered=False)
+                    res = db[dividend_collection_name].delete_many({'_id': {'$in': div_delete_ids}})
                     div_deleted = res.deleted_count
                     logger.info(f"Deleted {div_deleted} orphaned future dividends")
                 except Exception as e:
@@ -172,49 +216,31 @@ def save_announcements_to_mongodb(df, connection_string, db_name,
             future_bonuses = db[bonus_collection_name].find({
                 "exDate": {"$gte": today_start},
                 "metadata.source": "scstrade"
-            })
+            }, {'symbol': 1, 'exDate': 1})
             
-            bonus_delete_ops = []
-            for doc in future_bonuses:
-                key = (doc.get('symbol'), doc.get('exDate'))
-                if key not in incoming_bonus_keys:
-                    bonus_delete_ops.append(pymongo.DeleteOne({'_id': doc['_id']}))
+            bonus_delete_ids = [
+                doc['_id'] for doc in future_bonuses
+                if (doc.get('symbol'), doc.get('exDate')) not in incoming_bonus_keys
+            ]
                     
-            if bonus_delete_ops:
+            if bonus_delete_ids:
                 try:
-                    res = db[bonus_collection_name].bulk_write(bonus_delete_ops, ordered=False)
+                    res = db[bonus_collection_name].delete_many({'_id': {'$in': bonus_delete_ids}})
                     bonus_deleted = res.deleted_count
                     logger.info(f"Deleted {bonus_deleted} orphaned future bonuses")
                 except Exception as e:
                     logger.warning(f"Failed to delete orphaned bonuses: {e}")
 
 
-        # Bulk write dividends
-        if dividends:
-            div_ops = []
-            for doc in dividends:
-                div_ops.append(pymongo.InsertOne(doc))
-            
-            if div_ops:
-                try:
-                    res = db[dividend_collection_name].bulk_write(div_ops, ordered=False)
-                    div_inserted = res.inserted_count
-                except pymongo.errors.BulkWriteError as bwe:
-                    # Ignore duplicate key errors, count successful inserts
-                    div_inserted = bwe.details['nInserted']
-
-        # Bulk write bonuses
-        if bonuses:
-            bonus_ops = []
-            for doc in bonuses:
-                bonus_ops.append(pymongo.InsertOne(doc))
-                
-            if bonus_ops:
-                try:
-                    res = db[bonus_collection_name].bulk_write(bonus_ops, ordered=False)
-                    bonus_inserted = res.inserted_count
-                except pymongo.errors.BulkWriteError as bwe:
-                    bonus_inserted = bwe.details['nInserted']
+        # Insert new announcements; the unique index rejects ones already stored
+        div_coll = db[dividend_collection_name]
+        bonus_coll = db[bonus_collection_name]
+        if write_concern is not None:
+            div_coll = div_coll.with_options(write_concern=write_concern)
+            bonus_coll = bonus_coll.with_options(write_concern=write_concern)
+
+        div_inserted = insert_documents(div_coll, dividends)
+        bonus_inserted = insert_documents(bonus_coll, bonuses)
 
         msg = (f"Processed successfully. "
                f"Dividends: {div_inserted} inserted, {div_deleted} deleted; "
@@ -235,22 +261,27 @@ def get_collection_stats(connection_string, db_name,
         div_coll = db[dividend_collection_name]
         bonus_coll = db[bonus_collection_name]
 
-        div_count = div_coll.count_documents({})
-        bonus_count = bonus_coll.count_documents({})
+        # Count and ex-date range of dividends in a single round-trip
+        div_summary = next(div_coll.aggregate([
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "earliest": {"$min": "$exDate"},
+                "latest": {"$max": "$exDate"}
+            }}
+        ]), None)
+        # Unfiltered total, so collection metadata is enough (no scan)
+        bonus_count = bonus_coll.estimated_document_count()
 
         stats = {
-            "dividends_count": div_count,
+            "dividends_count": div_summary["count"] if div_summary else 0,
             "bonuses_count": bonus_count
         }
 
-        # Get earliest and latest dividend dates
-        div_earliest = div_coll.find_one(sort=[("exDate", pymongo.ASCENDING)])
-        div_latest = div_coll.find_one(sort=[("exDate", pymongo.DESCENDING)])
-        
-        if div_earliest:
-            stats["dividend_earliest_exdate"] = div_earliest.get('exDate')
-        if div_latest:
-            stats["dividend_latest_exdate"] = div_latest.get('exDate')
+        # Earliest and latest dividend dates
+        if div_summary:
+            stats["dividend_earliest_exdate"] = div_summary.get('earliest')
+            stats["dividend_latest_exdate"] = div_summary.get('latest')
 
         return stats
 
@@ -1,86 +1,101 @@
 from psx import stocks, tickers
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from psx.data_store import save_to_mongodb
+from psx.data_store import save_to_mongodb, setup_logging
 
+import argparse
 import datetime
 
 
-# tickers = tickers()
-
-start = datetime.date(2020, 8, 1)
-end = datetime.date(2021, 2, 1)
-
-data = stocks(["OGDC", "MEBL"], start=start, end=end)
-
-# Shape of data (rows, columns)
-print(f"Shape: {data.shape}")
-
-# Column names
-print(f"Columns: {data.columns.tolist()}")
-
-# Data types
-print(data.dtypes)
-
-# First 5 rows
-print(data.head())
-
-# Last 5 rows
-print(data.tail())
-
-# Save data to MongoDB
-# Uncomment and configure the connection string as needed
-# success, message = save_to_mongodb(
-#     df=data,
-#     symbol="MEBL",
-#     connection_string="mongodb://localhost:27017/",
-#     db_name="psx_stocks",
-#     collection_name="stock_data"
-# )
-# print(f"MongoDB Save Result: {success}")
-# print(f"Message: {message}")
-
-# Statistical summary
-# print(data.describe())
-
-# fig = go.Figure()
-
-# fig = make_subplots(rows=1, cols=1)
-
-# fig = make_subplots(rows=2,
-#                     cols=1,
-#                     shared_xaxes=True,
-#                     vertical_spacing=0.1,
-#                     subplot_titles=('EFERT', 'Volume'),
-#                     row_width=[0.3, 0.7])
-
-
-
-# fig.append_trace(
-#     go.Candlestick(
-#         x=data.index,
-#         open=data.Open,
-#         high=data.High,
-#         low=data.Low,
-#         close=data.Close,  
-#     ), row=1, col=1
-# )
-# fig.add_trace(
-#     go.Bar(x=data.index,
-#            y=data.Volume,
-#            marker_color="green",
-#            showlegend=False),
-#     row=2,
-#     col=1
-# )
-# # volume_bar = go.Figure()
-
-# fig.update_layout(title="EFERT Stocks",
-#                   yaxis_title="Price (PKR)",
-#                   width=1400,
-#                   height=700)
-
-# fig.update(layout_xaxis_rangeslider_visible=False)
-# fig.show()
-
+def plot(data, symbol):
+    """
+    Candlestick and volume chart for one symbol. plotly is imported here so
+    running the example without --plot does not pay for importing it.
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    if "Ticker" in (data.index.names or []):
+        data = data.xs(symbol, level="Ticker")
+
+    fig = make_subplots(rows=2,
+                        cols=1,
+                        shared_xaxes=True,
+                        vertical_spacing=0.1,
+                        subplot_titles=(symbol, 'Volume'),
+                        row_width=[0.3, 0.7])
+
+    fig.append_trace(
+        go.Candlestick(
+            x=data.index,
+            open=data.Open,
+            high=data.High,
+            low=data.Low,
+            close=data.Close,
+        ), row=1, col=1
+    )
+    fig.add_trace(
+        go.Bar(x=data.index,
+               y=data.Volume,
+               marker_color="green",
+               showlegend=False),
+        row=2,
+        col=1
+    )
+
+    fig.update_layout(title=f"{symbol} Stocks",
+                      yaxis_title="Price (PKR)",
+                      width=1400,
+                      height=700)
+
+    fig.update(layout_xaxis_rangeslider_visible=False)
+    fig.show()
+
+
+def main():
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Fetch sample PSX data and print a summary.")
+    parser.add_argument("--plot", action="store_true", help="Show a candlestick chart (requires plotly)")
+    args = parser.parse_args()
+
+    # tickers = tickers()
+
+    start = datetime.date(2020, 8, 1)
+    end = datetime.date(2021, 2, 1)
+
+    data = stocks(["OGDC", "MEBL"], start=start, end=end)
+
+    # Shape of data (rows, columns)
+    print(f"Shape: {data.shape}")
+
+    # Column names
+    print(f"Columns: {data.columns.tolist()}")
+
+    # Data types
+    print(data.dtypes)
+
+    # First 5 rows
+    print(data.head())
+
+    # Last 5 rows
+    print(data.tail())
+
+    # Save data to MongoDB
+    # Uncomment and configure the connection string as needed
+    # success, message = save_to_mongodb(
+    #     df=data,
+    #     symbol="MEBL",
+    #     connection_string="mongodb://localhost:27017/",
+    #     db_name="psx_stocks",
+    #     collection_name="stock_data"
+    # )
+    # print(f"MongoDB Save Result: {success}")
+    # print(f"Message: {message}")
+
+    # Statistical summary
+    # print(data.describe())
+
+    if args.plot:
+        plot(data, "OGDC")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,14 @@
 import os
 import argparse
 import json
-import time
-import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from psx import stocks
-from psx.data_store import save_to_mongodb
-from pymongo import MongoClient
+from psx.data_store import save_to_mongodb, get_client, setup_logging
+from psx.mongodb_helpers import RequestThrottle
 
 def connect_to_mongodb(connection_string, db_name):
-    client = MongoClient(connection_string)
+    client = get_client(connection_string)
     db = client[db_name]
     return client, db
 
@@ -32,6 +31,7 @@ def parse_date(date_str):
     return datetime.strptime(date_str, "%Y-%m-%d").date()
 
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="Fetch missing price gaps for stocks.")
     parser.add_argument("--file", type=str, default="price_gaps.json", help="Path to the JSON gaps file.")
     parser.add_argument("--min-days", type=int, default=7, help="Minimum missing trading days to warrant a fetch.")
@@ -69,12 +69,16 @@ def main():
     else:
         print(f"Processing all {len(symbols)} stocks...")
 
-    processed_count = 0
-    symbols_fully_resolved = []
+    # Gaps are fetched by a small pool of workers, one stock each; the shared
+    # throttle spaces out the start of every PSX request across workers
+    gap_workers = int(os.getenv("FINHISAAB_GAP_WORKERS", "4"))
+    throttle = RequestThrottle()
 
-    for symbol in symbols:
-        print(f"\n{'='*50}")
-        print(f"Processing {symbol}...")
+    def process_symbol(symbol):
+        """Fetch and save every valid gap of one stock. Returns the buffered
+        output and whether all of its gaps were resolved."""
+        output = [f"\n{'='*50}", f"Processing {symbol}..."]
+        log = output.append
         
         gaps = gaps_data[symbol]
         valid_gaps = []
@@ -86,12 +90,11 @@ def main():
                 valid_gaps.append(gap)
             else:
                 reason = "days < min-days" if gap['missing_trading_days'] < args.min_days else "start year < min-year"
-                print(f"  [Skipping] Gap {gap['start']} to {gap['end']} ({gap['missing_trading_days']} days): {reason}")
+                log(f"  [Skipping] Gap {gap['start']} to {gap['end']} ({gap['missing_trading_days']} days): {reason}")
 
         if not valid_gaps:
-             print(f"  => No valid gaps meeting criteria for {symbol}.")
-             symbols_fully_resolved.append(symbol)
-             continue
+            log(f"  => No valid gaps meeting criteria for {symbol}.")
+            return output, True
              
         symbol_success = True
         
@@ -99,22 +102,25 @@ def main():
             start_date = parse_date(gap['start'])
             end_date = parse_date(gap['end'])
             
-            print(f"\n  Fetching gap #{idx+1}/{len(valid_gaps)} for {symbol} ({start_date} to {end_date})")
+            log(f"\n  Fetching gap #{idx+1}/{len(valid_gaps)} for {symbol} ({start_date} to {end_date})")
             
             try:
                 if args.dry_run:
-                    print(f"  [DRY-RUN] Would fetch: stocks('{symbol}', start={start_date}, end={end_date})")
-                    print(f"  [DRY-RUN] Would save data to MongoDB collection: {collection_name}")
+                    log(f"  [DRY-RUN] Would fetch: stocks('{symbol}', start={start_date}, end={end_date})")
+                    log(f"  [DRY-RUN] Would save data to MongoDB collection: {collection_name}")
                 else:
+                    # Be nice to the PSX API
+                    throttle.wait(symbol_delay_min, symbol_delay_max)
                     symbol_df = stocks(symbol, start=start_date, end=end_date)
                     
-                    if symbol_df is None or symbol_df.empty:
-                        print(f"  No data returned by API for {symbol} between {start_date} and {end_date}.")
+                    record_count = 0 if symbol_df is None else len(symbol_df.index)
+                    if record_count == 0:
+                        log(f"  No data returned by API for {symbol} between {start_date} and {end_date}.")
                         # Depending on definition of success, this could mean the PSX API has no data for that gap.
                         # We will consider it 'processed' so we don't continually loop empty sections.
                         continue
                     
-                    print(f"  Retrieved {len(symbol_df)} records. Saving to DB...")
+                    log(f"  Retrieved {record_count} records. Saving to DB...")
                     success, message = save_to_mongodb(
                         df=symbol_df,
                         symbol=symbol,
@@ -123,28 +129,24 @@ def main():
                         collection_name=collection_name
                     )
                     
-                    print(f"  MongoDB Save Result: {'Success' if success else 'Failed'} - {message}")
+                    log(f"  MongoDB Save Result: {'Success' if success else 'Failed'} - {message}")
                     if not success:
                         symbol_success = False
-
-                # Delay between gap requests to be nice to the PSX API
-                if idx < len(valid_gaps) - 1:
-                    delay = random.uniform(symbol_delay_min, symbol_delay_max)
-                    time.sleep(delay)
                     
             except Exception as e:
-                print(f"  Error fetching or saving gap data for {symbol}: {e}")
+                log(f"  Error fetching or saving gap data for {symbol}: {e}")
                 symbol_success = False
 
-        if symbol_success:
-            symbols_fully_resolved.append(symbol)
-            
-        processed_count += 1
-        
-        # Delay between stocks
-        if processed_count < len(symbols):
-            delay = random.uniform(symbol_delay_min, symbol_delay_max)
-            time.sleep(delay)
+        return output, symbol_success
+
+    symbols_fully_resolved = []
+
+    with ThreadPoolExecutor(max_workers=max(1, gap_workers)) as executor:
+        # Output is printed in stock order as each stock finishes
+        for symbol, (output, resolved) in zip(symbols, executor.map(process_symbol, symbols)):
+            print("\n".join(output))
+            if resolved:
+                symbols_fully_resolved.append(symbol)
             
     print(f"\n{'='*50}")
     print(f"Finished processing batch of {len(symbols)} stocks.")
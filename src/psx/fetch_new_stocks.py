@@ -52,12 +52,12 @@ import random
 import datetime
 import argparse
 import pandas as pd
-from pymongo import MongoClient
+import pymongo
 from pymongo.errors import PyMongoError
 from bson import json_util
 
 from psx import stocks
-from psx.data_store import save_to_mongodb
+from psx.data_store import save_to_mongodb, get_client, setup_logging
 
 # Load environment variables from a .env file if python-dotenv is available
 try:
@@ -71,9 +71,8 @@ def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
     Perform a quick connectivity test to MongoDB.
     """
     try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        client.close()
+        with pymongo.timeout(5):
+            get_client(connection_string).admin.command('ping')
         return True
     except Exception as e:
         print(f"[-] MongoDB connectivity check FAILED: {e}")
@@ -114,18 +113,17 @@ def get_matching_symbols(connection_string, db_name, query_filter):
     """
     Queries the stocks collection and returns all matching symbols sorted alphabetically.
     """
-    client = MongoClient(connection_string)
-    db = client[db_name]
+    db = get_client(connection_string)[db_name]
     stocks_collection = db['stocks']
 
     print(f"[*] Querying 'stocks' collection with filter: {query_filter}")
     cursor = stocks_collection.find(query_filter, {'symbol': 1, '_id': 0})
     
     symbols = sorted([doc['symbol'] for doc in cursor if 'symbol' in doc])
-    client.close()
     return symbols
 
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(
         description="Query stocks collection and fetch/store price history from a specified date onwards."
     )
@@ -4,15 +4,18 @@ It reads from a generated JSON report (e.g., missing_data_report.json).
 """
 
 import os
-import json
-import time
-import random
 import datetime
 import argparse
+import threading
 import pandas as pd
 import math
+from concurrent.futures import ThreadPoolExecutor
 from psx import stocks
-from psx.data_store import save_to_mongodb
+from psx.mongodb_helpers import RequestThrottle
+from psx.data_store import (
+    save_to_mongodb, connect_to_mongodb, ensure_indexes,
+    dataframe_to_documents, build_upsert_operations, bulk_upsert, setup_logging
+)
 
 # Load environment variables from a .env file if python-dotenv is available
 try:
@@ -21,32 +24,119 @@ try:
 except Exception:
     pass
 
+# Prefer orjson for reading and rewriting the report when it is installed
+try:
+    import orjson  # type: ignore
+
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj, indent=True):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+except ImportError:
+    import json
+
+    def json_loads(data):
+        return json.loads(data)
+
+    def json_dumps(obj, indent=True):
+        return json.dumps(obj, indent=4 if indent else None).encode()
+
 def load_missing_data_report(filepath="missing_data_report.json"):
     """
     Loads the JSON report containing the missing data ranges.
     Format: {"SYMBOL": [{"start": "YYYY-MM-DD", "end": "YYYY-MM-DD"}]}
     """
     try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
+        with open(filepath, 'rb') as f:
+            return json_loads(f.read())
     except Exception as e:
         print(f"Error loading {filepath}: {e}")
         return None
 
+def save_missing_data_report(missing_data, filepath="missing_data_report.json"):
+    """
+    Writes the (partially processed) missing data report back to disk.
+    The report is written to a temporary file first and renamed over the old
+    one, so a crash mid-write never leaves a truncated report behind.
+    """
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(json_dumps(missing_data))
+    os.replace(tmp_path, filepath)
+
+def remove_completed_range(missing_data, symbol, start_str, end_str):
+    """
+    Removes a filled range from the in-memory report, dropping the symbol once
+    it has no missing ranges left.
+    """
+    if symbol not in missing_data:
+        return
+    missing_data[symbol] = [
+        r for r in missing_data[symbol]
+        if not (r['start'] == start_str and r['end'] == end_str)
+    ]
+    if not missing_data[symbol]:
+        del missing_data[symbol]
+
+def append_completed_ranges(log_path, symbols, start_str, end_str):
+    """
+    Appends one line per symbol to the completed-ranges log (JSON lines).
+    Cheap enough to call after every range, unlike rewriting the report.
+    """
+    with open(log_path, 'ab') as f:
+        for symbol in symbols:
+            f.write(json_dumps({"symbol": symbol, "start": start_str, "end": end_str}, indent=False) + b"\n")
+
+def replay_completed_ranges(missing_data, log_path):
+    """
+    Applies ranges recorded in the completed-ranges log (from a run that
+    stopped before its last checkpoint) to the loaded report.
+    Returns the number of entries applied.
+    """
+    if not os.path.exists(log_path):
+        return 0
+    applied = 0
+    with open(log_path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json_loads(line)
+            except ValueError:
+                # Partially written last line
+                continue
+            remove_completed_range(missing_data, entry['symbol'], entry['start'], entry['end'])
+            applied += 1
+    return applied
+
+def checkpoint_report(missing_data, filepath, log_path):
+    """
+    Rewrites the full report and clears the completed-ranges log it now includes.
+    """
+    save_missing_data_report(missing_data, filepath)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="Fill missing PSX data")
     parser.add_argument("--by-symbol", action="store_true", help="Loop by symbol instead of date periods")
     args = parser.parse_args()
 
     # --- Configuration ---
     input_file = "missing_data_report.json"
+    # Append-only log of filled ranges; folded into the report at checkpoints
+    completed_log = "completed_ranges.jsonl"
+    checkpoint_every = int(os.getenv("FINHISAAB_CHECKPOINT_EVERY", "10"))
     
     # MongoDB connection settings via environment variables
     connection_string = os.getenv("FINHISAAB_MONGO_URI", "mongodb://127.0.0.1:27017/")
     db_name = os.getenv("FINHISAAB_DB_NAME", "finhisaab")
     collection_name = os.getenv("FINHISAAB_COLLECTION", "stockpricehistories")
 
-    # Throttling controls
+    # Throttling controls: minimum spacing between PSX requests within a
+    # symbol/date range (SYMBOL) and when moving to the next one (BATCH)
     symbol_delay_min = float(os.getenv("FINHISAAB_SYMBOL_DELAY_MIN", "0.5"))
     symbol_delay_max = float(os.getenv("FINHISAAB_SYMBOL_DELAY_MAX", "1.0"))
     batch_delay_min = float(os.getenv("FINHISAAB_BATCH_DELAY_MIN", "1.0"))
@@ -54,14 +144,54 @@ def main():
     
     # Sub-batching setting for large lists of symbols
     fetch_batch_size = int(os.getenv("FINHISAAB_BATCH_SIZE", "10"))
+    # Date ranges fetched concurrently in date mode
+    fill_workers = int(os.getenv("FINHISAAB_FILL_WORKERS", "4"))
 
     print(f"Loading missing data from {input_file}...")
     missing_data = load_missing_data_report(input_file)
     
+    if missing_data:
+        replayed = replay_completed_ranges(missing_data, completed_log)
+        if replayed:
+            print(f"Skipping {replayed} symbol ranges already filled according to {completed_log}.")
+
     if not missing_data:
         print("No missing data found or file could not be read. Exiting.")
         return
 
+    completed_since_checkpoint = 0
+    progress_lock = threading.Lock()
+    throttle = RequestThrottle()
+
+    def mark_completed(symbols, start_str, end_str):
+        """Record a filled range; rewrite the full report every checkpoint_every ranges."""
+        nonlocal completed_since_checkpoint
+        with progress_lock:
+            for symbol in symbols:
+                remove_completed_range(missing_data, symbol, start_str, end_str)
+            try:
+                append_completed_ranges(completed_log, symbols, start_str, end_str)
+                completed_since_checkpoint += 1
+                if completed_since_checkpoint >= checkpoint_every:
+                    checkpoint_report(missing_data, input_file, completed_log)
+                    completed_since_checkpoint = 0
+                    print(f"  -> Progress checkpoint written to {input_file}.")
+            except Exception as e:
+                print(f"  -> Warning: Failed to update progress in {input_file}: {e}")
+
+    def final_checkpoint():
+        if not completed_since_checkpoint:
+            return
+        try:
+            checkpoint_report(missing_data, input_file, completed_log)
+            print(f"Progress saved to {input_file}.")
+        except Exception as e:
+            print(f"Warning: Failed to update progress in {input_file}: {e}")
+
+    # One collection handle (and pooled client) for every save in the run
+    collection = connect_to_mongodb(connection_string, db_name)[collection_name]
+    ensure_indexes(collection.database, collection_name)
+
     if args.by_symbol:
         print(f"Running in BY-SYMBOL mode across {len(missing_data)} symbols.")
         print("-" * 50)
@@ -70,21 +200,26 @@ def main():
             ranges = missing_data[symbol]
             print(f"\nProcessing symbol [{symbol_idx+1}/{len(symbols)}]: {symbol} ({len(ranges)} missing ranges)")
             
-            ranges_to_remove = []
-            
             for range_idx, r in enumerate(ranges):
                 start_str, end_str = r['start'], r['end']
-                start_date = datetime.datetime.strptime(start_str, "%Y-%m-%d").date()
-                end_date = datetime.datetime.strptime(end_str, "%Y-%m-%d").date()
+                start_date = datetime.date.fromisoformat(start_str)
+                end_date = datetime.date.fromisoformat(end_str)
                 
                 print(f"  -> Range [{range_idx+1}/{len(ranges)}]: {start_date} to {end_date}...")
                 
+                if range_idx == 0:
+                    delay = throttle.wait(batch_delay_min, batch_delay_max)
+                    if delay:
+                        print(f"    -> Waited {delay:.2f} seconds before this symbol.")
+                else:
+                    throttle.wait(symbol_delay_min, symbol_delay_max)
+
                 try:
                     df = stocks([symbol], start=start_date, end=end_date)
                     
                     if df is None or (isinstance(df, pd.DataFrame) and df.empty):
                         print("    -> No data found from PSX for this range.")
-                        ranges_to_remove.append(r)
+                        mark_completed([symbol], start_str, end_str)
                         continue
                         
                     symbol_df = None
@@ -102,45 +237,25 @@ def main():
                             
                     if symbol_df is None or symbol_df.empty:
                         print(f"    -> [ {symbol} ] No data found in retrieved batch.")
-                        ranges_to_remove.append(r)
+                        mark_completed([symbol], start_str, end_str)
                         continue
                         
                     success, message = save_to_mongodb(
                         df=symbol_df,
                         symbol=symbol,
-                        connection_string=connection_string,
-                        db_name=db_name,
-                        collection_name=collection_name
+                        collection=collection
                     )
                     
                     if not success:
                         print(f"    -> [ {symbol} ] Failed to save: {message}")
                     else:
                         print(f"    -> [ {symbol} ] Saved {len(symbol_df)} records.")
-                        ranges_to_remove.append(r)
+                        mark_completed([symbol], start_str, end_str)
                         
                 except Exception as e:
                     print(f"    -> Error fetching or saving data: {e}")
-                    
-                if range_idx < len(ranges) - 1:
-                    time.sleep(random.uniform(symbol_delay_min, symbol_delay_max))
-                    
-            if ranges_to_remove:
-                missing_data[symbol] = [r for r in missing_data[symbol] if r not in ranges_to_remove]
-                if not missing_data[symbol]:
-                    del missing_data[symbol]
-                    
-                try:
-                    with open(input_file, 'w') as f:
-                        json.dump(missing_data, f, indent=4)
-                    print(f"  -> Progress saved for {symbol}.")
-                except Exception as e:
-                    print(f"  -> Warning: Failed to update progress in {input_file}: {e}")
-                    
-            if symbol_idx < len(symbols) - 1:
-                delay = random.uniform(batch_delay_min, batch_delay_max)
-                print(f"Waiting {delay:.2f} seconds before next symbol...")
-                time.sleep(delay)
+
+        final_checkpoint()
 
         print("\n" + "=" * 50)
         print("FINISHED FILLING MISSING DATA (BY SYMBOL)")
@@ -158,31 +273,33 @@ def main():
             ranges_to_symbols[key].append(symbol)
             
     unique_ranges = list(ranges_to_symbols.keys())
+
+    # Convert strings to datetime.date objects (for sorting and the psx
+    # module) once per range
+    parsed_ranges = {
+        key: (datetime.date.fromisoformat(key[0]), datetime.date.fromisoformat(key[1]))
+        for key in unique_ranges
+    }
     
-    # Sort the unique ranges by duration in descending order (longest first)
-    def get_duration(date_range):
-        start_d = datetime.datetime.strptime(date_range[0], "%Y-%m-%d").date()
-        end_d = datetime.datetime.strptime(date_range[1], "%Y-%m-%d").date()
-        return (end_d - start_d).days
+    # Sort the unique ranges by the amount of data they cover (days in the
+    # range times the number of symbols missing it), largest first, so a
+    # partial run fills as many records as possible
+    def get_cost(date_range):
+        start_d, end_d = parsed_ranges[date_range]
+        return ((end_d - start_d).days + 1) * len(ranges_to_symbols[date_range])
 
-    unique_ranges.sort(key=get_duration, reverse=True)
+    unique_ranges.sort(key=get_cost, reverse=True)
 
     print(f"Found {len(unique_ranges)} unique missing date ranges across {len(missing_data)} symbols.")
     print("-" * 50)
 
-    for i, (start_str, end_str) in enumerate(unique_ranges):
+    def process_range(i, start_str, end_str):
+        """Fetch and save one date range for all its symbols; output is buffered
+        and printed in one piece so concurrent ranges do not interleave."""
         symbols_to_process = ranges_to_symbols[(start_str, end_str)]
-        
-        # Skip ranges that have 1 or 2 symbols (user will handle them later)
-        if len(symbols_to_process) <= 2:
-            print(f"\nSkipping range [{i+1}/{len(unique_ranges)}]: {start_str} to {end_str} as it only has {len(symbols_to_process)} symbol(s).")
-            continue
-        
-        # Convert strings to datetime.date objects for the psx module
-        start_date = datetime.datetime.strptime(start_str, "%Y-%m-%d").date()
-        end_date = datetime.datetime.strptime(end_str, "%Y-%m-%d").date()
-        
-        print(f"\nProcessing range [{i+1}/{len(unique_ranges)}]: {start_date} to {end_date} for {len(symbols_to_process)} symbols")
+        start_date, end_date = parsed_ranges[(start_str, end_str)]
+        output = [f"\nProcessing range [{i+1}/{len(unique_ranges)}]: {start_date} to {end_date} for {len(symbols_to_process)} symbols"]
+        log = output.append
         
         # Sub-divide symbols if the list is too large to fetch at once
         num_sub_batches = math.ceil(len(symbols_to_process) / fetch_batch_size)
@@ -195,18 +312,28 @@ def main():
             current_sub_batch = symbols_to_process[start_idx:end_idx]
             
             if num_sub_batches > 1:
-                print(f"  -> Sub-batch [{sub_batch_idx+1}/{num_sub_batches}] ({len(current_sub_batch)} symbols)...")
+                log(f"  -> Sub-batch [{sub_batch_idx+1}/{num_sub_batches}] ({len(current_sub_batch)} symbols)...")
+
+            # Longer spacing before the first request of a new date range
+            if sub_batch_idx == 0:
+                delay = throttle.wait(batch_delay_min, batch_delay_max)
+                if delay:
+                    log(f"    -> Waited {delay:.2f} seconds before this date range.")
+            else:
+                throttle.wait(symbol_delay_min, symbol_delay_max)
             
             try:
                 # Fetch data directly from PSX for this sub-batch
                 batch_data = stocks(current_sub_batch, start=start_date, end=end_date)
                 
                 if batch_data is None or (isinstance(batch_data, pd.DataFrame) and batch_data.empty):
-                    print(f"    -> No data found from PSX for this specific sub-batch.")
+                    log(f"    -> No data found from PSX for this specific sub-batch.")
                     # We might still continue with other sub-batches, but we mark this range 
                     # as basically 'done' since PSX returned nothing.
                     continue
                     
+                # Collect the whole sub-batch and write it in one bulk upsert
+                sub_batch_documents = []
                 for symbol in current_sub_batch:
                     # Resolve the DataFrame for this symbol
                     symbol_df = None
@@ -224,58 +351,57 @@ def main():
                             symbol_df = None
                     
                     if symbol_df is None or symbol_df.empty:
-                        print(f"    -> [ {symbol} ] No data found in batch.")
+                        log(f"    -> [ {symbol} ] No data found in batch.")
                         continue
                     
-                    success, message = save_to_mongodb(
-                        df=symbol_df,
-                        symbol=symbol,
-                        connection_string=connection_string,
-                        db_name=db_name,
-                        collection_name=collection_name
+                    sub_batch_documents.extend(dataframe_to_documents(symbol_df, symbol))
+                    log(f"    -> [ {symbol} ] Prepared {len(symbol_df)} records.")
+
+                if sub_batch_documents:
+                    inserted_count, updated_count, write_errors = bulk_upsert(
+                        collection, build_upsert_operations(sub_batch_documents)
                     )
-                    
-                    if not success:
-                        print(f"    -> [ {symbol} ] Failed to save: {message}")
+                    if write_errors:
+                        log(f"    -> Failed to save {len(write_errors)} of {len(sub_batch_documents)} "
+                            f"records: {write_errors[0].get('errmsg')}")
                         range_fully_successful = False
                     else:
-                        print(f"    -> [ {symbol} ] Saved {len(symbol_df)} records.")
+                        log(f"    -> Saved {len(sub_batch_documents)} records "
+                            f"({inserted_count} new, {updated_count} updated).")
                 
             except Exception as e:
-                print(f"    -> Error fetching or saving sub-batch data: {e}")
+                log(f"    -> Error fetching or saving sub-batch data: {e}")
                 range_fully_successful = False
-                
-            # Delay between sub-batches
-            if sub_batch_idx < num_sub_batches - 1:
-                time.sleep(random.uniform(symbol_delay_min, symbol_delay_max))
         
         # If we successfully processed (or verified empty) this entire date range for all symbols,
         # remove it from the report file so we don't repeat it if the script crashes later.
         if range_fully_successful:
-            for symbol in symbols_to_process:
-                if symbol in missing_data:
-                    # Filter out this specific range
-                    missing_data[symbol] = [
-                        r for r in missing_data[symbol] 
-                        if not (r['start'] == start_str and r['end'] == end_str)
-                    ]
-                    # If symbol has no more missing data, remove it from dict
-                    if not missing_data[symbol]:
-                        del missing_data[symbol]
-            
-            # Save the updated progress exactly back to the file
-            try:
-                with open(input_file, 'w') as f:
-                    json.dump(missing_data, f, indent=4)
-                print(f"  -> Progress saved. {start_str} to {end_str} removed from report.")
-            except Exception as e:
-                print(f"  -> Warning: Failed to update progress in {input_file}: {e}")
-        
-        # Delay between different date ranges to avoid rate limits
-        if i < len(unique_ranges) - 1:
-            delay = random.uniform(batch_delay_min, batch_delay_max)
-            print(f"Waiting {delay:.2f} seconds before next date range...")
-            time.sleep(delay)
+            mark_completed(symbols_to_process, start_str, end_str)
+            log(f"  -> Progress saved. {start_str} to {end_str} marked as filled.")
+
+        with output_lock:
+            print("\n".join(output))
+
+    # Ranges are fetched by a small pool of workers; the shared throttle still
+    # spaces out the start of every PSX request, so only the time spent
+    # waiting on responses and saving overlaps
+    output_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=max(1, fill_workers)) as executor:
+        futures = []
+        for i, (start_str, end_str) in enumerate(unique_ranges):
+            symbols_to_process = ranges_to_symbols[(start_str, end_str)]
+
+            # Skip ranges that have 1 or 2 symbols (user will handle them later)
+            if len(symbols_to_process) <= 2:
+                print(f"\nSkipping range [{i+1}/{len(unique_ranges)}]: {start_str} to {end_str} as it only has {len(symbols_to_process)} symbol(s).")
+                continue
+
+            futures.append(executor.submit(process_range, i, start_str, end_str))
+
+        for future in futures:
+            future.result()
+
+    final_checkpoint()
 
     print("\n" + "=" * 50)
     print("FINISHED FILLING MISSING DATA")
@@ -5,12 +5,21 @@ Script to identify missing price data intervals for PSX stocks in MongoDB.
 import os
 import datetime
 import json
+import hashlib
 import random
+import itertools
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import time
 import argparse
-import pandas as pd
-from pymongo import MongoClient
+import numpy as np
+from pymongo import UpdateOne
 from pymongo.errors import PyMongoError
+from psx.data_store import (
+    ensure_indexes, ensure_stock_indexes, get_client, query_plan_stages, date_to_datetime,
+    BOOKKEEPING_WRITE_CONCERN, setup_logging
+)
 
 
 # Load environment variables from a .env file if python-dotenv is available
@@ -20,85 +29,295 @@ try:
 except Exception:
     pass
 
-def get_stock_symbols(connection_string, db_name, batch_number=1, batch_size=10):
+def iter_stock_symbol_batches(stocks_collection, batch_size=10):
     """
-    Fetch stock symbols from the 'stocks' collection in MongoDB.
+    Yields lists of up to batch_size stock symbols from the 'stocks'
+    collection in MongoDB, sorted by marketCap descending (ties broken by _id
+    so the order is stable across runs).
+    A single cursor is consumed lazily, instead of one skip/limit query per
+    batch (skip re-scans every earlier document).
     """
-    client = None
     try:
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        stocks_collection = db['stocks']
-        
-        # Calculate the number of documents to skip
-        skip_amount = (batch_number - 1) * batch_size
-        
-        # Fetch symbols, sorted by marketCap descending
-        symbols = stocks_collection.find({}, {'symbol': 1, '_id': 0}) \
-                                   .sort('marketCap', -1) \
-                                   .skip(skip_amount) \
-                                   .limit(batch_size)
-        
-        return [s['symbol'] for s in symbols]
-    
+        cursor = stocks_collection.find({}, {'symbol': 1, '_id': 0}) \
+                                  .sort([('marketCap', -1), ('_id', 1)])
+        while True:
+            chunk = [s['symbol'] for s in itertools.islice(cursor, batch_size)]
+            if not chunk:
+                return
+            yield chunk
+
     except PyMongoError as e:
         print(f"Error fetching stock symbols: {e}")
-        return []
-    finally:
-        if 'client' in locals() and client:
-            client.close()
 
-def find_missing_dates(symbol, start_date, end_date, connection_string, db_name, collection_name, exclusions=None):
+def expected_business_dates(start_date, end_date, exclusions=None):
+    """
+    Builds the set of business dates (Mon-Fri) expected between start_date and
+    end_date, minus any excluded ranges (market holidays).
+    Returns a frozenset of datetime.date objects.
     """
-    Finds missing business dates in MongoDB for a specific stock within a date range.
+    days = np.arange(
+        np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1,
+        dtype='datetime64[D]'
+    )
+
+    # Every excluded day, passed to numpy as holidays in a single call
+    holidays = np.concatenate([
+        np.arange(np.datetime64(ex['start'], 'D'), np.datetime64(ex['end'], 'D') + 1,
+                  dtype='datetime64[D]')
+        for ex in exclusions or []
+    ] or [np.array([], dtype='datetime64[D]')])
+
+    # tolist() on datetime64[D] yields datetime.date objects
+    return frozenset(days[np.is_busday(days, holidays=holidays)].tolist())
+
+def exclusions_hash(exclusions=None):
+    """
+    Fingerprint of an exclusion list, stored with the completeness
+    bookkeeping so a stock verified against one holiday calendar is not
+    treated as complete under another. Order and duplicates do not matter.
+    """
+    ranges = sorted({(ex['start'], ex['end']) for ex in exclusions or []})
+    return hashlib.sha256(json.dumps(ranges).encode()).hexdigest()
+
+@functools.lru_cache(maxsize=8)
+def expected_window(expected_dates_set):
+    """
+    The parts of the missing-dates query that depend only on the expected
+    dates: (sorted dates, their YYYY-MM-DD strings, the $match date filter).
+    Cached, so every batch checked against the same window reuses them
+    instead of re-sorting and re-formatting the whole set.
+    """
+    expected = tuple(sorted(expected_dates_set))
+    expected_strs = tuple(d.isoformat() for d in expected)
+    date_filter = {
+        '$gte': date_to_datetime(expected[0]),
+        '$lte': datetime.datetime.combine(expected[-1], datetime.time.max)
+    }
+    return expected, expected_strs, date_filter
+
+def find_missing_dates(symbol, expected_dates_set, collection, meta_collection=None, exclusions=None):
+    """
+    Finds missing business dates in MongoDB for a specific stock.
+    expected_dates_set comes from expected_business_dates(), built with the
+    same exclusions.
+    If meta_collection is given, stocks already verified complete for the
+    window are answered from their stocks_meta entry without querying prices.
     Returns a list of missing dates (as datetime.date objects).
     """
-    client = None
+    if meta_collection is not None and expected_dates_set:
+        meta = load_symbol_meta(meta_collection, [symbol]).get(symbol)
+        expected = expected_window(expected_dates_set)[0]
+        if is_known_complete(meta, expected[0], expected[-1], exclusions_hash(exclusions)):
+            return []
+    return find_missing_dates_batch([symbol], expected_dates_set, collection).get(symbol, [])
+
+def find_missing_dates_batch(symbols, expected_dates_set, collection):
+    """
+    Finds missing business dates in MongoDB for several stocks, using a single
+    aggregation for all of them.
+    expected_dates_set comes from expected_business_dates().
+    Returns a dict mapping each symbol to its sorted list of missing dates
+    (empty if the query failed).
+    """
+    if not expected_dates_set:
+        return {symbol: [] for symbol in symbols}
+
     try:
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        collection = db[collection_name]
-
-        # Convert date to datetime.datetime for MongoDB query
-        start_dt = datetime.datetime.combine(start_date, datetime.time.min)
-        end_dt = datetime.datetime.combine(end_date, datetime.time.max)
-
-        # 1. Fetch dates currently in the DB
-        # Retrieve only the 'date' field
-        docs = collection.find(
-            {
-                'symbol': symbol,
-                'date': {'$gte': start_dt, '$lte': end_dt}
-            },
-            {'date': 1, '_id': 0}
-        )
-        
-        # Set of dates existing in DB
-        db_dates = {doc['date'].date() for doc in docs}
-
-        # 2. Generate expected business dates (Mon-Fri)
-        expected_dates = pd.bdate_range(start=start_date, end=end_date)
-        expected_dates_set = {pd.Timestamp(dt).date() for dt in expected_dates}
-
-        if exclusions:
-            for ex in exclusions:
-                ex_start = datetime.datetime.strptime(ex['start'], "%Y-%m-%d").date()
-                ex_end = datetime.datetime.strptime(ex['end'], "%Y-%m-%d").date()
-                ex_dates = pd.bdate_range(start=ex_start, end=ex_end)
-                ex_dates_set = {pd.Timestamp(dt).date() for dt in ex_dates}
-                expected_dates_set -= ex_dates_set
-
-        # 3. Find missing dates
-        missing_dates = sorted(list(expected_dates_set - db_dates))
-        
-        return missing_dates
+        expected, expected_strs, date_filter = expected_window(expected_dates_set)
+
+        # Let the server diff each symbol's stored dates against the expected
+        # ones, so only the missing dates come back. Dates are compared as
+        # YYYY-MM-DD strings to ignore any time component. allowDiskUse lets
+        # $group spill for long windows instead of hitting the memory limit.
+        pipeline = [
+            {'$match': {
+                'symbol': {'$in': list(symbols)},
+                'date': date_filter
+            }},
+            {'$group': {
+                '_id': '$symbol',
+                'dates': {'$addToSet': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$date'}}}
+            }},
+            {'$project': {'missing': {'$setDifference': [expected_strs, '$dates']}}}
+        ]
+        server_missing = {
+            doc['_id']: sorted(datetime.date.fromisoformat(d) for d in doc['missing'])
+            for doc in collection.aggregate(pipeline, allowDiskUse=True)
+        }
+
+        # Symbols without any stored rows in the window are missing every date
+        return {
+            symbol: server_missing.get(symbol, list(expected))
+            for symbol in symbols
+        }
         
     except PyMongoError as e:
-        print(f"Error querying database for {symbol}: {e}")
-        return []
-    finally:
-        if 'client' in locals() and client:
-            client.close()
+        print(f"Error querying database for {', '.join(symbols)}: {e}")
+        # Leave failed symbols out so they are never cached as complete
+        return {}
+
+def load_symbol_meta(meta_collection, symbols):
+    """
+    Reads the completeness bookkeeping of several stocks in one query.
+    Returns a dict mapping symbol to its stocks_meta document
+    ({symbol, complete_since, last_complete_date, exclusions_hash}).
+    """
+    try:
+        return {
+            doc['symbol']: doc
+            for doc in meta_collection.find({'symbol': {'$in': list(symbols)}}, {'_id': 0})
+        }
+    except PyMongoError as e:
+        print(f"Error reading stock metadata: {e}")
+        return {}
+
+def has_complete_window(meta, exclusions_key):
+    """
+    True if meta holds a verified window checked against the exclusions
+    fingerprinted by exclusions_key; anything else counts as unknown.
+    """
+    return (
+        bool(meta) and 'complete_since' in meta and 'last_complete_date' in meta
+        and meta.get('exclusions_hash') == exclusions_key
+    )
+
+def is_known_complete(meta, start_date, end_date, exclusions_key):
+    """
+    True if a previous run, using the same exclusions, already verified the
+    stock has no missing dates anywhere between start_date and end_date.
+    """
+    if not has_complete_window(meta, exclusions_key):
+        return False
+    return meta['complete_since'].date() <= start_date and meta['last_complete_date'].date() >= end_date
+
+def record_complete_symbols(meta_collection, symbol_meta, symbols, start_date, end_date, exclusions_key):
+    """
+    Records that the given stocks have no missing dates between start_date
+    and end_date under the exclusions fingerprinted by exclusions_key. A
+    previously verified window is merged in when it used the same exclusions
+    and the two overlap or only non-business days separate them, so the
+    bookkeeping never covers dates that were not checked.
+    """
+    operations = []
+    for symbol in symbols:
+        since, through = start_date, end_date
+        meta = symbol_meta.get(symbol)
+        if has_complete_window(meta, exclusions_key):
+            old_since = meta['complete_since'].date()
+            old_through = meta['last_complete_date'].date()
+            touches = (
+                np.busday_count(old_through + datetime.timedelta(days=1), start_date) <= 0
+                and np.busday_count(end_date + datetime.timedelta(days=1), old_since) <= 0
+            )
+            if touches:
+                since, through = min(since, old_since), max(through, old_through)
+        operations.append(UpdateOne(
+            {'symbol': symbol},
+            {'$set': {
+                'complete_since': date_to_datetime(since),
+                'last_complete_date': date_to_datetime(through),
+                'exclusions_hash': exclusions_key,
+                'updatedAt': datetime.datetime.now()
+            }},
+            upsert=True
+        ))
+
+    if not operations:
+        return
+    try:
+        meta_collection.bulk_write(operations, ordered=False)
+    except PyMongoError as e:
+        print(f"Error updating stock metadata: {e}")
+
+def load_missing_dates_cache(filepath, ttl_seconds):
+    """
+    Loads cached per-symbol missing dates from a previous run, dropping
+    entries older than ttl_seconds.
+    Returns {(symbol, start, end, expected_count): (cached_at, missing_dates)};
+    on disk each entry is a JSON object with ISO date strings.
+    """
+    if ttl_seconds <= 0 or not os.path.exists(filepath):
+        return {}
+    try:
+        with open(filepath, 'r') as f:
+            entries = json.load(f)
+        now = time.time()
+        return {
+            (entry['symbol'], datetime.date.fromisoformat(entry['start']),
+             datetime.date.fromisoformat(entry['end']), entry['expected_count']):
+            (entry['cached_at'], [datetime.date.fromisoformat(d) for d in entry['missing']])
+            for entry in entries
+            if now - entry['cached_at'] < ttl_seconds
+        }
+    except Exception as e:
+        print(f"Ignoring unreadable missing-dates cache {filepath}: {e}")
+        return {}
+
+def save_missing_dates_cache(cache, filepath):
+    """
+    Writes the missing-dates cache to disk as JSON.
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    entries = [
+        {
+            'symbol': symbol,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'expected_count': expected_count,
+            'cached_at': cached_at,
+            'missing': [d.isoformat() for d in missing_dates]
+        }
+        for (symbol, start, end, expected_count), (cached_at, missing_dates) in cache.items()
+    ]
+    with open(filepath, 'w') as f:
+        json.dump(entries, f)
+
+class MissingDataReport:
+    """
+    Writes the missing-data report one symbol at a time instead of holding
+    every symbol's ranges in memory until the end.
+    The file keeps the {"SYMBOL": [{"start": ..., "end": ...}]} format read by
+    fill_missing_data, one compact line per symbol. It is written to a
+    temporary file and renamed into place on close(), so an interrupted run
+    leaves any previous report intact; abort() removes the temporary file.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.count = 0
+        self._tmp_path = filepath + ".tmp"
+        self._file = open(self._tmp_path, 'w')
+        self._file.write("{")
+
+    def add(self, symbol, ranges):
+        separator = "," if self.count else ""
+        self._file.write(f"{separator}\n    {json.dumps(symbol)}: {json.dumps(ranges)}")
+        self.count += 1
+
+    def close(self):
+        """
+        Finishes the report. Returns True if it was saved, False if no symbol
+        had missing data (nothing is written then).
+        """
+        self._file.write("\n}\n")
+        self._file.close()
+        if not self.count:
+            os.remove(self._tmp_path)
+            return False
+        os.replace(self._tmp_path, self.filepath)
+        return True
+
+    def abort(self):
+        """
+        Discards an unfinished report: closes the temporary file and removes
+        it. Does nothing once close() has saved the report.
+        """
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
 
 def group_missing_dates(missing_dates, max_ignored_gap_size=1):
     """
@@ -109,38 +328,24 @@ def group_missing_dates(missing_dates, max_ignored_gap_size=1):
     if not missing_dates:
         return []
 
-    ranges = []
-    current_start = missing_dates[0]
-    current_end = missing_dates[0]
+    dates = np.array(missing_dates, dtype='datetime64[D]')
 
-    for i in range(1, len(missing_dates)):
-        next_dt = missing_dates[i]
-        
-        # Check if the next datetime is consecutive business day.
-        # It's better to just check if it's within 3 days (handling weekends)
-        diff = (next_dt - current_end).days
-        if diff <= 3: # Consecutive business days could be Friday->Monday (3 days diff)
-            current_end = next_dt
-        else:
-            # Check length of gap in business days
-            if len(pd.bdate_range(current_start, current_end)) > max_ignored_gap_size:
-                ranges.append({
-                    "start": current_start.strftime('%Y-%m-%d'),
-                    "end": current_end.strftime('%Y-%m-%d')
-                })
-            current_start = next_dt
-            current_end = next_dt
-
-    # Append the last range
-    if len(pd.bdate_range(current_start, current_end)) > max_ignored_gap_size:
-        ranges.append({
-            "start": current_start.strftime('%Y-%m-%d'),
-            "end": current_end.strftime('%Y-%m-%d')
-        })
+    # A new range starts wherever two missing dates are more than 3 days apart
+    # (consecutive business days can be Friday->Monday, a 3 day difference)
+    breaks = np.flatnonzero(np.diff(dates).astype(np.int64) > 3)
+    start_dates = dates[np.concatenate(([0], breaks + 1))]
+    end_dates = dates[np.concatenate((breaks, [len(dates) - 1]))]
 
-    return ranges
+    # Keep ranges longer than max_ignored_gap_size business days
+    keep = np.busday_count(start_dates, end_dates + 1) > max_ignored_gap_size
+
+    return [
+        {"start": str(start), "end": str(end)}
+        for start, end in zip(start_dates[keep], end_dates[keep])
+    ]
 
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="Identify missing price data intervals for PSX stocks in MongoDB.")
     parser.add_argument(
         "--start-date", type=str, default="2026-05-25",
@@ -241,11 +446,16 @@ def main():
     connection_string = os.getenv("FINHISAAB_MONGO_URI", "mongodb://127.0.0.1:27017/")
     db_name = os.getenv("FINHISAAB_DB_NAME", "finhisaab")
     collection_name = os.getenv("FINHISAAB_COLLECTION", "stockpricehistories")
+    meta_collection_name = os.getenv("FINHISAAB_META_COLLECTION", "stocks_meta")
 
     # Batching configuration
     batch_size = int(os.getenv("FINHISAAB_BATCH_SIZE", "10"))
     max_batches_env = os.getenv("FINHISAAB_MAX_BATCHES", "None")  
     max_batches = int(max_batches_env) if max_batches_env and max_batches_env.strip().isdigit() else None
+    # Symbol batches queried concurrently
+    query_workers = int(os.getenv("FINHISAAB_QUERY_WORKERS", "4"))
+    # Print the query plans used by the check (FINHISAAB_EXPLAIN=1)
+    explain = os.getenv("FINHISAAB_EXPLAIN", "").strip().lower() in ("1", "true", "yes")
     
     # Gap filtering configuration
     max_ignored_gap_size = args.threshold
@@ -253,71 +463,161 @@ def main():
     # Output file
     output_filename = "missing_data_report.json"
 
+    # Identical for every symbol, so computed once for the whole run
+    expected_dates_set = expected_business_dates(start_date, end_date, exclusions)
+    exclusions_key = exclusions_hash(exclusions)
+
+    # Optional on-disk cache of query results for repeated runs over the same
+    # window; disabled unless FINHISAAB_DATES_CACHE_TTL (seconds) is set, and
+    # never used for windows reaching today since those still change
+    cache_file = os.getenv("FINHISAAB_DATES_CACHE_FILE", os.path.join(".cache", "psx_missing_dates.json"))
+    cache_ttl = int(os.getenv("FINHISAAB_DATES_CACHE_TTL", "0"))
+    use_cache = cache_ttl > 0 and bool(expected_dates_set) and end_date < datetime.date.today()
+    dates_cache = load_missing_dates_cache(cache_file, cache_ttl) if use_cache else {}
+
+    def cache_key(symbol):
+        return (symbol, start_date, end_date, len(expected_dates_set))
+
     print(f"Checking for missing PSX data between {start_date} and {end_date}")
     print(f"DB: {db_name}.{collection_name}")
     print("-" * 50)
 
     batch_number = 1
     processed_batches = 0
-    
-    all_missing_data = {} # Format: { "symbol": [{"start": "...", "end": "..."}] }
+    analyzed_symbols = 0
     total_symbols_with_gaps = 0
 
-    while True:
-        symbols_to_process = get_stock_symbols(
-            connection_string,
-            db_name,
-            batch_number=batch_number,
-            batch_size=batch_size
-        )
-
-        if not symbols_to_process:
-            break
-
-        print(f"\nProcessing Batch #{batch_number} ({len(symbols_to_process)} symbols)...")
-
-        for symbol in symbols_to_process:
-            missing_dates = find_missing_dates(
-                symbol, start_date, end_date, 
-                connection_string, db_name, collection_name,
-                exclusions
+    # One shared client (and connection pool) for every query in the run
+    client = get_client(connection_string)
+    stocks_collection = client[db_name]['stocks']
+    collection = client[db_name][collection_name]
+    meta_collection = client[db_name].get_collection(
+        meta_collection_name, write_concern=BOOKKEEPING_WRITE_CONCERN
+    )
+    # The date lookups below rely on the (symbol, date) index, the symbol
+    # listing on the marketCap index, and the bookkeeping lookups on symbol
+    ensure_indexes(client[db_name], collection_name)
+    ensure_stock_indexes(client[db_name])
+    meta_collection.create_index('symbol', unique=True)
+
+    def check_batch(symbols_to_process):
+        """Missing dates for one batch of symbols."""
+        # Stocks already verified complete for the window need no query;
+        # then cached results, then one aggregation for the rest
+        symbol_meta = load_symbol_meta(meta_collection, symbols_to_process)
+        batch_missing_dates = {
+            symbol: [] for symbol in symbols_to_process
+            if is_known_complete(symbol_meta.get(symbol), start_date, end_date, exclusions_key)
+        }
+        batch_missing_dates.update({
+            symbol: dates_cache[cache_key(symbol)][1]
+            for symbol in symbols_to_process
+            if symbol not in batch_missing_dates and cache_key(symbol) in dates_cache
+        })
+        uncached_symbols = [s for s in symbols_to_process if s not in batch_missing_dates]
+        if uncached_symbols:
+            fresh = find_missing_dates_batch(uncached_symbols, expected_dates_set, collection)
+            batch_missing_dates.update(fresh)
+            record_complete_symbols(
+                meta_collection, symbol_meta,
+                [symbol for symbol, missing_dates in fresh.items() if not missing_dates],
+                start_date, end_date, exclusions_key
             )
-
-            if missing_dates:
-                ranges = group_missing_dates(missing_dates, max_ignored_gap_size)
-                
-                if ranges:
-                    all_missing_data[symbol] = ranges
-                    total_symbols_with_gaps += 1
-                    print(f"[{symbol}] Missing {len(missing_dates)} business days -> {len(ranges)} date ranges (> {max_ignored_gap_size} days)")
-                    for r in ranges:
-                        print(f"  - {r['start']} to {r['end']}")
-                else:
-                    print(f"[{symbol}] Data completely up to date (or only small gaps <= {max_ignored_gap_size} days).")
-            else:
-                print(f"[{symbol}] Data completely up to date.")
-
-        batch_number += 1
-        processed_batches += 1
+            if use_cache:
+                cached_at = time.time()
+                for symbol, missing_dates in fresh.items():
+                    dates_cache[cache_key(symbol)] = (cached_at, missing_dates)
+        return batch_missing_dates
+
+    symbol_batches = iter_stock_symbol_batches(stocks_collection, batch_size=batch_size)
+    if max_batches is not None:
+        symbol_batches = itertools.islice(symbol_batches, max_batches)
+
+    # Optional sanity check that both queries are index scans; the first
+    # batch supplies the probe symbol and is put back in front
+    if explain:
+        first_batch = next(symbol_batches, None)
+        if first_batch:
+            probe = first_batch[0]
+            start_dt = date_to_datetime(start_date)
+            print("Query plans:")
+            print("  stocks by marketCap: " + query_plan_stages(
+                stocks_collection.find({}, {'symbol': 1, '_id': 0}).sort([('marketCap', -1), ('_id', 1)])))
+            print(f"  {collection_name} dates ({probe}): " + query_plan_stages(
+                collection.find({'symbol': probe, 'date': {'$gte': start_dt}}, {'date': 1, '_id': 0})))
+            symbol_batches = itertools.chain([first_batch], symbol_batches)
+
+    def checked_batches(executor):
+        """
+        (symbols, missing dates) for each batch, in batch order. Only a few
+        batches are in flight at a time, so the symbol cursor is read as the
+        run progresses instead of all up front.
+        """
+        in_flight = max(1, query_workers) * 2
+        pending = collections.deque()
+        for symbols in symbol_batches:
+            pending.append((symbols, executor.submit(check_batch, symbols)))
+            if len(pending) >= in_flight:
+                done_symbols, future = pending.popleft()
+                yield done_symbols, future.result()
+        while pending:
+            done_symbols, future = pending.popleft()
+            yield done_symbols, future.result()
+
+    # Format: { "symbol": [{"start": "...", "end": "..."}] }
+    # An exception or Ctrl-C before the report is closed discards the
+    # partial temporary file
+    report = MissingDataReport(output_filename)
+    try:
+        # Batches are queried concurrently (each query mostly waits on the
+        # server); results are reported in batch order
+        with ThreadPoolExecutor(max_workers=max(1, query_workers)) as executor:
+            for symbols_to_process, batch_missing_dates in checked_batches(executor):
+                print(f"\nProcessing Batch #{batch_number} ({len(symbols_to_process)} symbols)...")
+
+                for symbol in symbols_to_process:
+                    missing_dates = batch_missing_dates.get(symbol, [])
+                    if missing_dates:
+                        ranges = group_missing_dates(missing_dates, max_ignored_gap_size)
+
+                        if ranges:
+                            report.add(symbol, ranges)
+                            total_symbols_with_gaps += 1
+                            print(f"[{symbol}] Missing {len(missing_dates)} business days -> {len(ranges)} date ranges (> {max_ignored_gap_size} days)")
+                            for r in ranges:
+                                print(f"  - {r['start']} to {r['end']}")
+                        else:
+                            print(f"[{symbol}] Data completely up to date (or only small gaps <= {max_ignored_gap_size} days).")
+                    else:
+                        print(f"[{symbol}] Data completely up to date.")
+
+                batch_number += 1
+                processed_batches += 1
+                analyzed_symbols += len(symbols_to_process)
 
         if max_batches is not None and processed_batches >= max_batches:
             print(f"Reached FINHISAAB_MAX_BATCHES={max_batches}. Stopping check.")
-            break
 
-    print("\n" + "=" * 50)
-    print("FINISHED MISSING DATA CHECK")
-    print(f"Analyzed {processed_batches * batch_size} symbols.")
-    print(f"Found missing data for {total_symbols_with_gaps} symbols.")
-    print("=" * 50)
+        if use_cache:
+            try:
+                save_missing_dates_cache(dates_cache, cache_file)
+            except Exception as e:
+                print(f"Failed to save missing-dates cache: {e}")
 
-    # Save absolute report to JSON file
-    if all_missing_data:
+        print("\n" + "=" * 50)
+        print("FINISHED MISSING DATA CHECK")
+        print(f"Analyzed {analyzed_symbols} symbols.")
+        print(f"Found missing data for {total_symbols_with_gaps} symbols.")
+        print("=" * 50)
+
+        # Finish the JSON report written during the run
         try:
-            with open(output_filename, 'w') as f:
-                json.dump(all_missing_data, f, indent=4)
-            print(f"Detailed JSON report saved to {os.path.abspath(output_filename)}")
+            if report.close():
+                print(f"Detailed JSON report saved to {os.path.abspath(output_filename)}")
         except Exception as e:
             print(f"Failed to save JSON report: {e}")
+    finally:
+        report.abort()
 
 if __name__ == "__main__":
     main()
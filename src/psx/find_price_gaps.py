@@ -1,21 +1,78 @@
 import os
 import argparse
 import json
-from datetime import datetime
-from pymongo import MongoClient
+import itertools
+from operator import itemgetter
+import numpy as np
+from bson.codec_options import CodecOptions, DatetimeConversion
+from psx.data_store import ensure_indexes, ensure_stock_indexes, get_client, setup_logging
+
+# Symbols whose dates are read with one query
+SYMBOL_BATCH_SIZE = 20
 
 def connect_to_mongodb(connection_string, db_name):
-    client = MongoClient(connection_string)
+    client = get_client(connection_string)
     db = client[db_name]
     return client, db
 
+def find_symbol_gaps(symbol_ms, master_ms, master_days):
+    """
+    Gaps in one stock's history, relative to the master trading calendar.
+    symbol_ms and master_ms are sorted, unique epoch-millisecond arrays;
+    master_days holds the matching YYYY-MM-DD strings.
+    """
+    # Position of each of the symbol's dates in the master calendar
+    positions = np.searchsorted(master_ms, symbol_ms)
+    matched = positions < len(master_ms)
+    matched[matched] = master_ms[positions[matched]] == symbol_ms[matched]
+
+    if not (matched[0] and matched[-1]):
+        # Fallback if date wasn't matching up cleanly in master index (shouldn't happen)
+        return []
+    actual_indices = positions[matched]
+
+    # Expected days are the master calendar between the symbol's first and last date
+    missing_indices = np.setdiff1d(
+        np.arange(actual_indices[0], actual_indices[-1] + 1), actual_indices, assume_unique=True
+    )
+
+    if not missing_indices.size:
+        return []
+
+    # Group missing indices into contiguous gaps
+    breaks = np.flatnonzero(np.diff(missing_indices) > 1)
+    gap_starts = missing_indices[np.concatenate(([0], breaks + 1))]
+    gap_ends = missing_indices[np.concatenate((breaks, [len(missing_indices) - 1]))]
+
+    # Format the gaps
+    symbol_gaps_formatted = []
+    for gap_start, gap_end in zip(gap_starts.tolist(), gap_ends.tolist()):
+        last_actual = "N/A"
+        if gap_start > 0:
+            last_actual = master_days[gap_start - 1]
+
+        symbol_gaps_formatted.append({
+            "start": master_days[gap_start],
+            "end": master_days[gap_end],
+            "missing_trading_days": gap_end - gap_start + 1,
+            "last_actual_date": last_actual
+        })
+
+    return symbol_gaps_formatted
+
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="Find missing price gaps for stocks.")
     parser.add_argument("--start", type=int, default=1, help="Start index (1-based) of the stocks to process.")
     parser.add_argument("--end", type=int, default=None, help="End index (1-based) of the stocks.")
     parser.add_argument("--out", type=str, default="price_gaps.json", help="Output JSON file name.")
     args = parser.parse_args()
 
+    start_idx = max(0, args.start - 1)
+    if args.end is not None and args.end <= start_idx:
+        print(f"Empty stock range: --start {args.start} is after --end {args.end}. Nothing to do.")
+        return
+
     # Connection settings from env or default
     connection_string = os.getenv("FINHISAAB_MONGO_URI", "mongodb://192.168.0.131:27017/")
     db_name = os.getenv("FINHISAAB_DB_NAME", "finhisaab")
@@ -24,8 +81,15 @@ def main():
     print(f"Connecting to MongoDB at {connection_string}, DB: {db_name}")
 
     client, db = connect_to_mongodb(connection_string, db_name)
-    history_coll = db[collection_name]
+    # Dates are decoded as raw epoch milliseconds (DatetimeMS) instead of
+    # datetime objects, and handled as numpy int64 arrays from there on
+    history_coll = db[collection_name].with_options(
+        codec_options=CodecOptions(datetime_conversion=DatetimeConversion.DATETIME_MS)
+    )
     stocks_coll = db["stocks"]
+    # The per-symbol date lookups below are covered by the (symbol, date) index
+    ensure_indexes(db, collection_name)
+    ensure_stock_indexes(db)
 
     print(f"Fetching distinct trading dates from {collection_name}...")
     # Get all distinct trading dates as the master PSX calendar
@@ -34,86 +98,53 @@ def main():
         print("No dates found in the database. Exiting.")
         return
 
-    # Ensure all dates are comparable types and sorted
-    master_dates = sorted([d if isinstance(d, datetime) else d for d in all_dates])
-    master_date_to_index = {d: i for i, d in enumerate(master_dates)}
-    print(f"Found {len(master_dates)} distinct trading dates. (from {master_dates[0].strftime('%Y-%m-%d')} to {master_dates[-1].strftime('%Y-%m-%d')})")
+    # Sorted, unique trading days as epoch milliseconds
+    master_ms = np.unique(np.fromiter((int(d) for d in all_dates), dtype=np.int64, count=len(all_dates)))
+    master_days = master_ms.astype('datetime64[ms]').astype('datetime64[D]').astype(str).tolist()
+    print(f"Found {len(master_ms)} distinct trading dates. (from {master_days[0]} to {master_days[-1]})")
 
-    # Fetch symbols sorted by marketCap descending
+    # Fetch symbols sorted by marketCap descending; the requested index range
+    # is applied by the server so only those symbols are read
     print("Fetching stocks sorted by marketCap (descending)...")
-    symbols_cursor = stocks_coll.find({}, {'symbol': 1, 'marketCap': 1, '_id': 0}).sort('marketCap', -1)
-    all_symbols = [s['symbol'] for s in symbols_cursor]
+    symbols_cursor = stocks_coll.find({}, {'symbol': 1, 'marketCap': 1, '_id': 0}) \
+                                .sort([('marketCap', -1), ('_id', 1)]) \
+                                .skip(start_idx)
+    if args.end is not None:
+        # Non-empty here: an empty range returned early above, since limit(0)
+        # would mean no limit
+        symbols_cursor = symbols_cursor.limit(args.end - start_idx)
+    symbols_to_process = [s['symbol'] for s in symbols_cursor]
     
-    total_symbols = len(all_symbols)
-    start_idx = max(0, args.start - 1)
-    end_idx = args.end if args.end is not None else total_symbols
-    
-    symbols_to_process = all_symbols[start_idx:end_idx]
-    print(f"Processing stocks from index {start_idx + 1} to {min(end_idx, total_symbols)} (Total: {len(symbols_to_process)} stocks)")
+    print(f"Processing stocks from index {start_idx + 1} to {start_idx + len(symbols_to_process)} (Total: {len(symbols_to_process)} stocks)")
 
     results = {}
     
-    for count, symbol in enumerate(symbols_to_process, 1):
-        if count % 10 == 0:
-            print(f"Processing {count}/{len(symbols_to_process)}: {symbol}...")
-            
-        symbol_docs = history_coll.find({"symbol": symbol}, {"date": 1, "_id": 0})
-        symbol_dates_raw = [doc["date"] for doc in symbol_docs if "date" in doc]
-        
-        if not symbol_dates_raw:
-            continue
-            
-        symbol_dates = sorted([d if isinstance(d, datetime) else d for d in symbol_dates_raw])
-        symbol_min = symbol_dates[0]
-        symbol_max = symbol_dates[-1]
-        
-        # Determine the subset of expected days from the master calendar
-        min_idx = master_date_to_index.get(symbol_min)
-        max_idx = master_date_to_index.get(symbol_max)
-        
-        if min_idx is None or max_idx is None:
-            # Fallback if date wasn't matching up cleanly in master index (shouldn't happen)
-            continue
-            
-        expected_indices = set(range(min_idx, max_idx + 1))
-        actual_indices = set([master_date_to_index[d] for d in symbol_dates if d in master_date_to_index])
-        
-        missing_indices = sorted(list(expected_indices - actual_indices))
-        
-        if not missing_indices:
-            continue
-            
-        # Group missing indices into contiguous gaps
-        gaps = []
-        current_gap = [missing_indices[0]]
-        
-        for i in range(1, len(missing_indices)):
-            if missing_indices[i] == current_gap[-1] + 1:
-                current_gap.append(missing_indices[i])
-            else:
-                gaps.append(current_gap)
-                current_gap = [missing_indices[i]]
-        if current_gap:
-            gaps.append(current_gap)
-            
-        # Format the gaps
-        symbol_gaps_formatted = []
-        for gap in gaps:
-            start_date = master_dates[gap[0]].strftime('%Y-%m-%d')
-            end_date = master_dates[gap[-1]].strftime('%Y-%m-%d')
-            last_actual = "N/A"
-            if gap[0] > 0:
-                last_actual = master_dates[gap[0] - 1].strftime('%Y-%m-%d')
-            
-            symbol_gaps_formatted.append({
-                "start": start_date,
-                "end": end_date,
-                "missing_trading_days": len(gap),
-                "last_actual_date": last_actual
-            })
-            
-        if symbol_gaps_formatted:
-            results[symbol] = symbol_gaps_formatted
+    for offset in range(0, len(symbols_to_process), SYMBOL_BATCH_SIZE):
+        batch = symbols_to_process[offset:offset + SYMBOL_BATCH_SIZE]
+
+        # One index-covered scan for the whole batch, sorted so each symbol's
+        # dates arrive together and in order
+        cursor = history_coll.find(
+            {"symbol": {"$in": batch}}, {"symbol": 1, "date": 1, "_id": 0}
+        ).sort([("symbol", 1), ("date", 1)]).batch_size(5000)
+        batch_dates = {
+            symbol: np.unique(np.fromiter(
+                (int(doc["date"]) for doc in docs if "date" in doc), dtype=np.int64
+            ))
+            for symbol, docs in itertools.groupby(cursor, key=itemgetter("symbol"))
+        }
+
+        for count, symbol in enumerate(batch, offset + 1):
+            if count % 10 == 0:
+                print(f"Processing {count}/{len(symbols_to_process)}: {symbol}...")
+
+            symbol_ms = batch_dates.get(symbol)
+            if symbol_ms is None or not symbol_ms.size:
+                continue
+
+            symbol_gaps_formatted = find_symbol_gaps(symbol_ms, master_ms, master_days)
+            if symbol_gaps_formatted:
+                results[symbol] = symbol_gaps_formatted
 
     print(f"\nFound gaps for {len(results)} stocks out of {len(symbols_to_process)} processed.")
     
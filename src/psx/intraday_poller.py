@@ -22,7 +22,6 @@ from datetime import time as time_type
 
 import pymongo
 import requests
-from pymongo import MongoClient
 from pymongo.errors import BulkWriteError, PyMongoError
 
 try:
@@ -32,7 +31,8 @@ except Exception:
     pass
 
 from psx.company_quote_scraper import scrape_company_quote
-from psx.mongodb_cron import get_stock_symbols_range
+from psx.data_store import get_client
+from psx.mongodb_helpers import get_stock_symbols_range, test_mongo_connectivity
 
 logger = logging.getLogger(__name__)
 
@@ -48,30 +48,6 @@ INTRADAY_COLLECTION = "intraday_klines_temp"
 # MongoDB helpers
 # ---------------------------------------------------------------------------
 
-def test_mongo_connectivity(connection_string, db_name):
-    """
-    Perform a quick connectivity test to MongoDB.
-
-    Attempts to connect and run a simple ping command. Returns True if
-    successful, False otherwise.
-    """
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        _ = client[db_name].name
-        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
-        return True
-    except Exception as e:
-        print(f"MongoDB connectivity check FAILED: {e}")
-        return False
-    finally:
-        try:
-            if 'client' in locals():
-                client.close()
-        except Exception:
-            pass
-
-
 def ensure_indexes(collection):
     """
     Create indexes on intraday_klines_temp. Idempotent — safe to call every startup.
@@ -341,8 +317,8 @@ def main():
         return
     logger.info("Loaded %d symbols for %s.", len(symbols), range_label)
 
-    dst_client = MongoClient(dst_uri)
-    collection = dst_client[dst_db_name][INTRADAY_COLLECTION]
+    # Shared client from the connectivity check; closed at interpreter exit
+    collection = get_client(dst_uri)[dst_db_name][INTRADAY_COLLECTION]
     ensure_indexes(collection)
 
     cycle_number = 0
@@ -382,9 +358,6 @@ def main():
 
     except KeyboardInterrupt:
         logger.info("Interrupted. Shutting down.")
-    finally:
-        dst_client.close()
-        logger.info("MongoDB connection closed.")
 
 
 if __name__ == "__main__":
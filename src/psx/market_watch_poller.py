@@ -49,7 +49,6 @@ from datetime import time as time_type
 
 import pymongo
 import requests
-from pymongo import MongoClient
 from pymongo.errors import BulkWriteError
 
 try:
@@ -58,7 +57,9 @@ try:
 except Exception:
     pass
 
+from psx.data_store import get_client
 from psx.market_watch_scraper import fetch_market_watch
+from psx.mongodb_helpers import test_mongo_connectivity
 
 logger = logging.getLogger(__name__)
 
@@ -78,24 +79,6 @@ INTRADAY_COLLECTION = "intraday_klines_temp"
 # MongoDB helpers
 # ---------------------------------------------------------------------------
 
-def test_mongo_connectivity(connection_string, db_name):
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        client.admin.command("ping")
-        _ = client[db_name].name
-        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
-        return True
-    except Exception as e:
-        print(f"MongoDB connectivity check FAILED: {e}")
-        return False
-    finally:
-        try:
-            if "client" in locals():
-                client.close()
-        except Exception:
-            pass
-
-
 def ensure_indexes(collection):
     """Create indexes on intraday_klines_temp. Idempotent — safe to call every startup."""
     collection.create_index(
@@ -501,8 +484,8 @@ def main():
         logger.error("MongoDB unreachable. Exiting.")
         return
 
-    dst_client = MongoClient(dst_uri)
-    collection = dst_client[dst_db_name][INTRADAY_COLLECTION]
+    # Shared client from the connectivity check; closed at interpreter exit
+    collection = get_client(dst_uri)[dst_db_name][INTRADAY_COLLECTION]
     ensure_indexes(collection)
 
     stasis   = StasisDetector(stasis_thresh, holiday_recheck, stasis_min_minutes)
@@ -552,9 +535,6 @@ def main():
 
     except KeyboardInterrupt:
         logger.info("Interrupted. Shutting down.")
-    finally:
-        dst_client.close()
-        logger.info("MongoDB connection closed.")
 
 
 if __name__ == "__main__":
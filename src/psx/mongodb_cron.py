@@ -13,15 +13,17 @@ Omit both flags to process all stocks (default / backward-compatible).
 """
 
 from psx import stocks
-from psx.data_store import save_to_mongodb
+from psx.data_store import (
+    save_to_mongodb, ensure_indexes, ensure_stock_indexes, connect_to_mongodb, setup_logging
+)
+from psx.mongodb_helpers import test_mongo_connectivity, get_stock_symbols_range
 import argparse
 import datetime
 import time
 import random
 import pandas as pd
 import os
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables from a .env file if python-dotenv is available
 try:
@@ -31,64 +33,8 @@ except Exception:
     pass
 
 
-def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
-    """
-    Perform a quick connectivity test to MongoDB.
-
-    Attempts to connect and run a simple ping command. Returns True if
-    successful, False otherwise.
-    """
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        # Run a simple admin ping to verify connectivity
-        client.admin.command('ping')
-        # Optionally touch the target DB to ensure we can access it
-        _ = client[db_name].name
-        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
-        return True
-    except Exception as e:
-        print(f"MongoDB connectivity check FAILED: {e}")
-        return False
-    finally:
-        try:
-            if 'client' in locals():
-                client.close()
-        except Exception:
-            pass
-
-
-def get_stock_symbols_range(connection_string, db_name, start_rank=1, end_rank=None):
-    """
-    Fetch stock symbols from MongoDB sorted by marketCap descending.
-
-    start_rank / end_rank are 1-based and inclusive.  end_rank=None means
-    fetch from start_rank to the end of the collection.
-    """
-    client = None
-    try:
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        stocks_collection = db['stocks']
-
-        skip = start_rank - 1
-        limit = (end_rank - start_rank + 1) if end_rank is not None else 0
-
-        cursor = stocks_collection.find({}, {'symbol': 1, '_id': 0}) \
-                                  .sort('marketCap', -1) \
-                                  .skip(skip)
-        if limit > 0:
-            cursor = cursor.limit(limit)
-
-        return [s['symbol'] for s in cursor]
-
-    except PyMongoError as e:
-        print(f"Error fetching stock symbols: {e}")
-        return []
-    finally:
-        if client is not None:
-            client.close()
-
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="PSX daily data fetch cron job.")
     parser.add_argument(
         "--start", type=int, default=1,
@@ -139,12 +85,19 @@ def main():
         print("Exiting due to MongoDB connectivity failure.")
         return
 
+    # Build the price and stock-listing indexes up front instead of on the first save
+    collection = connect_to_mongodb(connection_string, db_name)[collection_name]
+    ensure_indexes(collection.database, collection_name)
+    ensure_stock_indexes(collection.database)
+
     # Throttling configuration via environment variables
     batch_size = int(os.getenv("FINHISAAB_BATCH_SIZE", "10"))
     symbol_delay_min = float(os.getenv("FINHISAAB_SYMBOL_DELAY_MIN", "0.3"))
     symbol_delay_max = float(os.getenv("FINHISAAB_SYMBOL_DELAY_MAX", "0.7"))
     batch_delay_min = float(os.getenv("FINHISAAB_BATCH_DELAY_MIN", "1"))
     batch_delay_max = float(os.getenv("FINHISAAB_BATCH_DELAY_MAX", "2"))
+    # Background threads writing fetched data to MongoDB
+    save_workers = int(os.getenv("FINHISAAB_SAVE_WORKERS", "4"))
 
     # Fetch the assigned slice of symbols from MongoDB in one query
     all_symbols = get_stock_symbols_range(connection_string, db_name, start_rank, end_rank)
@@ -158,64 +111,75 @@ def main():
     # Chunk into internal batches for throttling
     batches = [all_symbols[i:i + batch_size] for i in range(0, len(all_symbols), batch_size)]
 
-    for batch_number, symbols_to_process in enumerate(batches, start=1):
-        print(f"\n{'='*50}")
-        print(f"Batch {batch_number}/{len(batches)}: {len(symbols_to_process)} symbols")
-
-        batch_data = None
-        try:
-            print(f"Attempting batch fetch for symbols: {symbols_to_process}")
-            batch_data = stocks(symbols_to_process, start=start_date, end=end_date)
-        except Exception as e:
-            print(f"Batch fetch failed; will fallback to per-symbol fetch. Error: {e}")
-
-        for i, symbol in enumerate(symbols_to_process):
-            print(f"\nProcessing symbol: {symbol} for range {start_date} to {end_date}")
+    # MongoDB writes are handed to a small thread pool so they overlap with
+    # the PSX fetches and throttling delays instead of blocking them
+    with ThreadPoolExecutor(max_workers=max(1, save_workers)) as save_executor:
+        for batch_number, symbols_to_process in enumerate(batches, start=1):
+            print(f"\n{'='*50}")
+            print(f"Batch {batch_number}/{len(batches)}: {len(symbols_to_process)} symbols")
 
+            pending_saves = []
+            batch_data = None
             try:
-                symbol_df = None
-                if isinstance(batch_data, dict) and symbol in batch_data:
-                    symbol_df = batch_data[symbol]
-                elif isinstance(batch_data, pd.DataFrame):
-                    try:
-                        index_names = list(batch_data.index.names or [])
-                        if 'Ticker' in index_names:
-                            symbol_df = batch_data.xs(symbol, level='Ticker')
-                    except Exception:
-                        symbol_df = None
-
-                if symbol_df is None:
-                    print("Fetching individually for symbol due to unavailable batch data slice...")
-                    symbol_df = stocks(symbol, start=start_date, end=end_date)
-
-                if symbol_df is None or symbol_df.empty:
-                    print(f"No data found for {symbol} in this range.")
-                else:
-                    print(f"Retrieved {len(symbol_df)} records for {symbol}")
-                    print(f"Saving data to MongoDB ({db_name}.{collection_name}) for {symbol}...")
-                    success, message = save_to_mongodb(
-                        df=symbol_df,
-                        symbol=symbol,
-                        connection_string=connection_string,
-                        db_name=db_name,
-                        collection_name=collection_name
-                    )
-                    print(f"MongoDB Save Result: {'Success' if success else 'Failed'}")
-                    print(f"Message: {message}")
+                print(f"Attempting batch fetch for symbols: {symbols_to_process}")
+                batch_data = stocks(symbols_to_process, start=start_date, end=end_date)
             except Exception as e:
-                print(f"An error occurred while fetching data for {symbol}: {e}")
-                failed_symbols.append((symbol, str(e)))
-
-            # Delay between symbols to avoid overload (always runs even if errors occurred)
-            if i < len(symbols_to_process) - 1:
-                delay = random.uniform(symbol_delay_min, symbol_delay_max)
-                print(f"Waiting {delay:.2f} seconds before next symbol...")
-                time.sleep(delay)
-
-        if batch_number < len(batches):
-            batch_delay = random.uniform(batch_delay_min, batch_delay_max)
-            print(f"\nCompleted batch {batch_number}. Waiting {batch_delay:.2f} seconds...")
-            time.sleep(batch_delay)
+                print(f"Batch fetch failed; will fallback to per-symbol fetch. Error: {e}")
+
+            for i, symbol in enumerate(symbols_to_process):
+                print(f"\nProcessing symbol: {symbol} for range {start_date} to {end_date}")
+
+                try:
+                    symbol_df = None
+                    if isinstance(batch_data, dict) and symbol in batch_data:
+                        symbol_df = batch_data[symbol]
+                    elif isinstance(batch_data, pd.DataFrame):
+                        try:
+                            index_names = list(batch_data.index.names or [])
+                            if 'Ticker' in index_names:
+                                symbol_df = batch_data.xs(symbol, level='Ticker')
+                        except Exception:
+                            symbol_df = None
+
+                    if symbol_df is None:
+                        print("Fetching individually for symbol due to unavailable batch data slice...")
+                        symbol_df = stocks(symbol, start=start_date, end=end_date)
+
+                    record_count = 0 if symbol_df is None else len(symbol_df.index)
+                    if record_count == 0:
+                        print(f"No data found for {symbol} in this range.")
+                    else:
+                        print(f"Retrieved {record_count} records for {symbol}")
+                        print(f"Queueing save to MongoDB ({db_name}.{collection_name}) for {symbol}...")
+                        pending_saves.append((symbol, save_executor.submit(
+                            save_to_mongodb,
+                            df=symbol_df,
+                            symbol=symbol,
+                            collection=collection
+                        )))
+                except Exception as e:
+                    print(f"An error occurred while fetching data for {symbol}: {e}")
+                    failed_symbols.append((symbol, str(e)))
+
+                # Delay between symbols to avoid overload (always runs even if errors occurred)
+                if i < len(symbols_to_process) - 1:
+                    delay = random.uniform(symbol_delay_min, symbol_delay_max)
+                    print(f"Waiting {delay:.2f} seconds before next symbol...")
+                    time.sleep(delay)
+
+            # Saves ran in the background during the fetches and delays above
+            for symbol, future in pending_saves:
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, str(e)
+                print(f"MongoDB Save Result for {symbol}: {'Success' if success else 'Failed'}")
+                print(f"Message: {message}")
+
+            if batch_number < len(batches):
+                batch_delay = random.uniform(batch_delay_min, batch_delay_max)
+                print(f"\nCompleted batch {batch_number}. Waiting {batch_delay:.2f} seconds...")
+                time.sleep(batch_delay)
 
     print(f"\n{'='*50}")
     print(f"All {len(all_symbols)} symbols processed for {range_label}.")
@@ -1,16 +1,35 @@
 """
 Example script demonstrating how to fetch PSX data and store it in MongoDB.
+
+Performance profile: I/O-bound. Nearly all wall time is spent waiting on
+PSX HTTPS responses and MongoDB round-trips; the DataFrame work is small.
+Changes that pay off here, roughly in order:
+
+1. Fewer round-trips: $in batching (coverage check), bulk writes
+   (FailedIntervalRecorder, save_to_mongodb).
+2. One pooled client per process (data_store.get_client).
+3. Keyset pagination on (marketCap, _id) instead of skip().
+4. Wire compression (data_store.MONGO_COMPRESSORS).
+5. Overlapping I/O on a small thread pool (FINHISAAB_SYMBOL_WORKERS).
+
+Vectorizing or compiling the Python code here will not move the needle.
 """
 
 from psx import stocks
-from psx.data_store import save_to_mongodb
+from psx.mongodb_helpers import RequestThrottle, test_mongo_connectivity
+from psx.data_store import (
+    save_to_mongodb, get_client, ensure_indexes, ensure_stock_indexes, date_to_datetime,
+    BOOKKEEPING_WRITE_CONCERN, DUPLICATE_KEY_ERROR, setup_logging
+)
 import datetime
 import time
 import random
 import pandas as pd
 import os
-from pymongo import MongoClient
-from pymongo.errors import PyMongoError, DuplicateKeyError
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
 # Load environment variables from a .env file if python-dotenv is available
 try:
@@ -19,126 +38,165 @@ try:
 except Exception:
     pass
 
-def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
+class FailedIntervalRecorder:
     """
-    Perform a quick connectivity test to MongoDB.
+    Buffer failed data fetch intervals and record them in MongoDB for manual
+    review later, in one bulk write per flush instead of one round-trip per
+    failure. Duplicates are skipped silently. Safe to share between threads.
 
-    Attempts to connect and run a simple ping command. Returns True if
-    successful, False otherwise.
-    """
-    try:
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        # Run a simple admin ping to verify connectivity
-        client.admin.command('ping')
-        # Optionally touch the target DB to ensure we can access it
-        _ = client[db_name].name
-        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
-        return True
-    except Exception as e:
-        print(f"MongoDB connectivity check FAILED: {e}")
-        return False
-    finally:
-        try:
-            if 'client' in locals():
-                client.close()
-        except Exception:
-            pass
-
-def record_failed_interval(symbol, interval_start, interval_end, connection_string, db_name, reason):
-    """
-    Record a failed data fetch interval in MongoDB for manual review later.
-    Duplicates are skipped/updated silently.
-    
     Args:
-        symbol (str): Stock symbol
-        interval_start (datetime.date): Start date of the interval
-        interval_end (datetime.date): End date of the interval
-        connection_string (str): MongoDB connection string
-        db_name (str): MongoDB database name
-        reason (str): Reason for failure
-        
-    Returns:
-        bool: True if successful, False otherwise
+        failed_intervals (pymongo.collection.Collection): 'failed_intervals' collection
+        flush_size (int): Buffered intervals that trigger an automatic flush
     """
-    try:
-        # Connect to MongoDB
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        failed_intervals = db['failed_intervals']
-        
+
+    def __init__(self, failed_intervals, flush_size=100):
+        self.failed_intervals = failed_intervals
+        self.flush_size = flush_size
+        self.pending = []
+        self._lock = threading.Lock()
+
+    def add(self, symbol, interval_start, interval_end, reason):
+        """
+        Buffer one failed interval.
+
+        Args:
+            symbol (str): Stock symbol
+            interval_start (datetime.date): Start date of the interval
+            interval_end (datetime.date): End date of the interval
+            reason (str): Reason for failure
+        """
         # Convert date objects to datetime objects for MongoDB compatibility
-        start_datetime = datetime.datetime.combine(interval_start, datetime.time.min)
-        end_datetime = datetime.datetime.combine(interval_end, datetime.time.min)
+        start_datetime = date_to_datetime(interval_start)
+        end_datetime = date_to_datetime(interval_end)
         now = datetime.datetime.now()
-        
-        document = {
+
+        key = {
             'symbol': symbol,
             'interval_start': start_datetime,
-            'interval_end': end_datetime,
-            'reason': reason,
-            'createdAt': now,
-            'updatedAt': now
+            'interval_end': end_datetime
         }
-        
+
+        # Inserts the interval, or leaves an existing record for the same
+        # interval untouched
+        operation = UpdateOne(
+            key,
+            {'$setOnInsert': {
+                'reason': reason,
+                'createdAt': now,
+                'updatedAt': now
+            }},
+            upsert=True
+        )
+        with self._lock:
+            self.pending.append(operation)
+            full = len(self.pending) >= self.flush_size
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered intervals.
+
+        Returns:
+            bool: True if successful (or nothing to write), False otherwise
+        """
+        with self._lock:
+            operations, self.pending = self.pending, []
+        if not operations:
+            return True
+
         try:
-            failed_intervals.insert_one(document)
-        except DuplicateKeyError:
-            # Silently skip if it already exists due to unique index
-            pass
-            
+            self.failed_intervals.bulk_write(operations, ordered=False)
+            return True
+        except BulkWriteError as bwe:
+            # Two upserts racing on the same interval can hit the unique index;
+            # the interval is recorded either way, so only other errors count
+            errors = [
+                err for err in bwe.details.get('writeErrors', [])
+                if err.get('code') != DUPLICATE_KEY_ERROR
+            ]
+            if not errors:
+                return True
+            print(f"Error recording {len(errors)} of {len(operations)} failed intervals: "
+                  f"{errors[0].get('errmsg')}")
+            return False
+        except PyMongoError as e:
+            print(f"Error recording {len(operations)} failed intervals: {e}")
+            return False
+
+def ensure_failed_intervals_index(failed_intervals):
+    """
+    Create the unique (symbol, interval_start, interval_end) index that keeps
+    FailedIntervalRecorder upserts from creating duplicates.
+
+    Args:
+        failed_intervals (pymongo.collection.Collection): 'failed_intervals' collection
+
+    Returns:
+        bool: True if the index exists, False otherwise
+    """
+    try:
+        failed_intervals.create_index(
+            [('symbol', 1), ('interval_start', 1), ('interval_end', 1)],
+            unique=True
+        )
         return True
-        
     except PyMongoError as e:
-        print(f"Error recording failed interval: {e}")
+        print(f"Could not create failed_intervals index: {e}")
         return False
-    finally:
-        if 'client' in locals():
-            client.close()
 
-def get_stock_symbols(connection_string, db_name, batch_number=1, batch_size=10):
+def get_stock_symbols(stocks_collection, after=None, batch_size=10):
     """
-    Fetch stock symbols from the 'stock' collection in MongoDB, sorted by marketCap.
+    Fetch the next batch of stock symbols from the 'stock' collection in
+    MongoDB, sorted by marketCap.
+
+    Uses keyset pagination: each batch starts right after the (marketCap, _id)
+    key of the previous one, so the server seeks on the index instead of
+    walking and discarding every earlier document the way skip() does.
 
     Args:
-        connection_string (str): MongoDB connection string.
-        db_name (str): MongoDB database name.
-        batch_number (int): The batch number to fetch (e.g., 1 for the first 50, 2 for the next 50).
+        stocks_collection (pymongo.collection.Collection): The 'stocks' collection.
+        after (tuple): (marketCap, _id) key returned with the previous batch,
+            or None for the first batch.
         batch_size (int): The number of stocks in each batch.
 
     Returns:
-        list: A list of stock symbols.
+        tuple: (symbols, last_key) where symbols is a list of stock symbols
+            and last_key is the key to pass as `after` for the next batch.
     """
-    client = None
     try:
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        stocks_collection = db['stocks']
-
-        # Calculate the number of documents to skip
-        skip_amount = (batch_number - 1) * batch_size
-
-        # Fetch symbols, sorted by marketCap descending
-        symbols = stocks_collection.find({}, {'symbol': 1, '_id': 0}) \
-                                   .sort('marketCap', -1) \
-                                   .skip(skip_amount) \
-                                   .limit(batch_size)
-
-        return [s['symbol'] for s in symbols]
+        query = {}
+        if after is not None:
+            market_cap, last_id = after
+            if market_cap is None:
+                # Stocks without a marketCap sort last
+                query = {'marketCap': None, '_id': {'$gt': last_id}}
+            else:
+                query = {'$or': [
+                    {'marketCap': {'$lt': market_cap}},
+                    {'marketCap': market_cap, '_id': {'$gt': last_id}},
+                    {'marketCap': None}
+                ]}
+
+        # Fetch symbols, sorted by marketCap descending (_id breaks ties)
+        docs = list(stocks_collection.find(query, {'symbol': 1, 'marketCap': 1}) \
+                                     .sort([('marketCap', -1), ('_id', 1)]) \
+                                     .limit(batch_size))
+
+        if not docs:
+            return [], after
+        return [d['symbol'] for d in docs], (docs[-1].get('marketCap'), docs[-1]['_id'])
 
     except PyMongoError as e:
         print(f"Error fetching stock symbols: {e}")
-        return []
-    finally:
-        if 'client' in locals():
-            client.close()
+        return [], after
 
 def check_symbols_data_coverage(
     symbols,
     start_date,
     end_date,
-    connection_string,
-    db_name,
-    collection_name,
+    collection,
     tolerance_days=5
 ):
     """
@@ -149,9 +207,7 @@ def check_symbols_data_coverage(
         symbols (list): List of stock symbols to check.
         start_date (datetime.date): Start date of the range to check.
         end_date (datetime.date): End date of the range to check.
-        connection_string (str): MongoDB connection string.
-        db_name (str): Database name.
-        collection_name (str): Collection name.
+        collection (pymongo.collection.Collection): Price history collection.
         tolerance_days (int): Number of days margin before/after range (default: 5).
 
     Returns:
@@ -169,12 +225,7 @@ def check_symbols_data_coverage(
     if not symbols:
         return {}
 
-    client = None
     try:
-        client = MongoClient(connection_string)
-        db = client[db_name]
-        collection = db[collection_name]
-
         # Expand date range with tolerance margin
         start_dt_with_margin = datetime.datetime.combine(
             start_date - datetime.timedelta(days=tolerance_days),
@@ -258,11 +309,9 @@ def check_symbols_data_coverage(
             'last_date': None,
             'should_skip': False
         } for symbol in symbols}
-    finally:
-        if client:
-            client.close()
 
 def main():
+    setup_logging()
     # Define the dynamic date range for daily cron run - # TODO
     start_date = datetime.date(2014, 7, 1) #July 1st, 2014
     end_date = datetime.date(2014, 12, 31) # December 31st, 2014
@@ -280,6 +329,18 @@ def main():
         print("Exiting due to MongoDB connectivity failure.")
         return
 
+    # One shared client for every query and save in the run
+    db = get_client(connection_string)[db_name]
+    collection = db[collection_name]
+    stocks_collection = db['stocks']
+    failed_intervals = db.get_collection('failed_intervals', write_concern=BOOKKEEPING_WRITE_CONCERN)
+    # The coverage checks run before the first save would create the
+    # (symbol, date) index, so ensure it up front
+    ensure_indexes(db, collection_name)
+    ensure_stock_indexes(db)
+    ensure_failed_intervals_index(failed_intervals)
+    failed_recorder = FailedIntervalRecorder(failed_intervals)
+
     # --- Fetch stock symbols from MongoDB in batches and process ---
 
     # Batching and throttling configuration via environment variables
@@ -292,9 +353,85 @@ def main():
     symbol_delay_max = float(os.getenv("FINHISAAB_SYMBOL_DELAY_MAX", "2"))
     batch_delay_min = float(os.getenv("FINHISAAB_BATCH_DELAY_MIN", "5"))
     batch_delay_max = float(os.getenv("FINHISAAB_BATCH_DELAY_MAX", "7"))
+    # Symbols resolved and saved concurrently within a batch
+    symbol_workers = int(os.getenv("FINHISAAB_SYMBOL_WORKERS", "4"))
+
+    # Spaces out individual PSX fetches across workers
+    throttle = RequestThrottle()
+
+    def process_symbol(symbol, batch_data):
+        """Resolve, save and record failures for one symbol; output is
+        buffered and returned so concurrent symbols do not interleave."""
+        output = [f"\nProcessing symbol: {symbol} for range {start_date} to {end_date}"]
+        log = output.append
+
+        # Resolve the DataFrame for this symbol
+        try:
+            symbol_df = None
+            if isinstance(batch_data, dict) and symbol in batch_data:
+                symbol_df = batch_data[symbol]
+            elif isinstance(batch_data, pd.DataFrame):
+                # If the batch data is a MultiIndex DataFrame with 'Ticker' level, slice it
+                try:
+                    df_candidate = batch_data
+                    index_names = list(df_candidate.index.names or [])
+                    if 'Ticker' in index_names:
+                        symbol_df = df_candidate.xs(symbol, level='Ticker')
+                except Exception:
+                    symbol_df = None
+
+            # Fallback to single-symbol fetch if needed
+            if symbol_df is None:
+                delay = throttle.wait(symbol_delay_min, symbol_delay_max)
+                if delay:
+                    log(f"Waited {delay:.2f} seconds before fetching {symbol}...")
+                log(f"Fetching individually for symbol {symbol} due to unavailable batch data slice...")
+                symbol_df = stocks(symbol, start=start_date, end=end_date)
+
+            record_count = 0 if symbol_df is None else len(symbol_df.index)
+            if record_count == 0:
+                log(f"No data found for {symbol} in this range. Recording failure.")
+                failed_recorder.add(
+                    symbol,
+                    start_date,
+                    end_date,
+                    reason="No data found or empty dataframe returned"
+                )
+                return output
+            else:
+                log(f"Retrieved {record_count} records for {symbol}")
+        except Exception as e:
+            log(f"An error occurred while fetching data for {symbol}: {e}")
+            failed_recorder.add(
+                symbol,
+                start_date,
+                end_date,
+                reason=f"Exception during fetch: {str(e)}"
+            )
+            return output
+
+        # Save data to MongoDB
+        log(f"Saving data to MongoDB ({db_name}.{collection_name}) for {symbol}...")
+        success, message = save_to_mongodb(
+            df=symbol_df,
+            symbol=symbol,
+            collection=collection
+        )
+        log(f"MongoDB Save Result: {'Success' if success else 'Failed'}")
+        log(f"Message: {message}")
+
+        if not success:
+            failed_recorder.add(
+                symbol,
+                start_date,
+                end_date,
+                reason=f"Failed to save to MongoDB: {message}"
+            )
+        return output
 
     batch_number = 1
     processed_batches = 0
+    last_key = None
 
     # Performance tracking
     total_symbols_processed = 0
@@ -306,10 +443,9 @@ def main():
             print(f"\n{'='*50}")
             print(f"Fetching batch #{batch_number} of up to {batch_size} symbols...")
 
-            symbols_to_process = get_stock_symbols(
-                connection_string,
-                db_name,
-                batch_number=batch_number,
+            symbols_to_process, last_key = get_stock_symbols(
+                stocks_collection,
+                after=last_key,
                 batch_size=batch_size
             )
 
@@ -325,9 +461,7 @@ def main():
                 symbols=symbols_to_process,
                 start_date=start_date,
                 end_date=end_date,
-                connection_string=connection_string,
-                db_name=db_name,
-                collection_name=collection_name,
+                collection=collection,
                 tolerance_days=5
             )
 
@@ -374,81 +508,15 @@ def main():
                 print(f"Batch fetch failed; will fallback to per-symbol fetch. Error: {e}")
                 batch_data = None
 
-            for i, symbol in enumerate(symbols_to_fetch):
-                print(f"\nProcessing symbol: {symbol} for range {start_date} to {end_date}")
+            # Symbols are resolved and saved by a small pool of workers; each
+            # worker's output is printed in symbol order once it finishes
+            with ThreadPoolExecutor(max_workers=max(1, symbol_workers)) as executor:
+                for output in executor.map(lambda symbol: process_symbol(symbol, batch_data),
+                                           symbols_to_fetch):
+                    print("\n".join(output))
 
-                # Resolve the DataFrame for this symbol
-                try:
-                    symbol_df = None
-                    if isinstance(batch_data, dict) and symbol in batch_data:
-                        symbol_df = batch_data[symbol]
-                    elif isinstance(batch_data, pd.DataFrame):
-                        # If the batch data is a MultiIndex DataFrame with 'Ticker' level, slice it
-                        try:
-                            df_candidate = batch_data
-                            index_names = list(df_candidate.index.names or [])
-                            if 'Ticker' in index_names:
-                                symbol_df = df_candidate.xs(symbol, level='Ticker')
-                        except Exception:
-                            symbol_df = None
-                    
-                    # Fallback to single-symbol fetch if needed
-                    if symbol_df is None:
-                        print(f"Fetching individually for symbol {symbol} due to unavailable batch data slice...")
-                        symbol_df = stocks(symbol, start=start_date, end=end_date)
-
-                    if symbol_df is None or symbol_df.empty:
-                        print(f"No data found for {symbol} in this range. Recording failure.")
-                        record_failed_interval(
-                            symbol,
-                            start_date,
-                            end_date,
-                            connection_string,
-                            db_name,
-                            reason="No data found or empty dataframe returned"
-                        )
-                        continue
-                    else:
-                        print(f"Retrieved {len(symbol_df)} records for {symbol}")
-                except Exception as e:
-                    print(f"An error occurred while fetching data for {symbol}: {e}")
-                    record_failed_interval(
-                        symbol,
-                        start_date,
-                        end_date,
-                        connection_string,
-                        db_name,
-                        reason=f"Exception during fetch: {str(e)}"
-                    )
-                    continue
-
-                # Save data to MongoDB
-                print(f"Saving data to MongoDB ({db_name}.{collection_name}) for {symbol}...")
-                success, message = save_to_mongodb(
-                    df=symbol_df,
-                    symbol=symbol,
-                    connection_string=connection_string,
-                    db_name=db_name,
-                    collection_name=collection_name
-                )
-                print(f"MongoDB Save Result: {'Success' if success else 'Failed'}")
-                print(f"Message: {message}")
-
-                if not success:
-                    record_failed_interval(
-                        symbol,
-                        start_date,
-                        end_date,
-                        connection_string,
-                        db_name,
-                        reason=f"Failed to save to MongoDB: {message}"
-                    )
-
-                # Delay between symbols to avoid overload
-                if i < len(symbols_to_fetch) - 1:
-                    delay = random.uniform(symbol_delay_min, symbol_delay_max)
-                    print(f"Waiting {delay:.2f} seconds before next symbol...")
-                    time.sleep(delay)
+            # Record this batch's failures in one write
+            failed_recorder.flush()
 
             # Delay between batches
             batch_delay = random.uniform(batch_delay_min, batch_delay_max)
@@ -475,6 +543,8 @@ def main():
         print("All batches processed for the current run.")
 
     except (Exception, KeyboardInterrupt) as e:
+        # Keep the failures seen before the crash
+        failed_recorder.flush()
         print(f"\n{'='*50}")
         print(f"CRITICAL: Script stopped abruptly due to: {e.__class__.__name__} - {e}")
         print("--- LAST PROCESSING STATE ---")
@@ -0,0 +1,94 @@
+"""
+MongoDB helpers shared by the PSX fetch scripts (mongodb_cron,
+mongodb_example, intraday_poller, fill_missing_data, fetch_gaps).
+"""
+
+import random
+import threading
+import time
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+from psx.data_store import get_client
+
+
+def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
+    """
+    Perform a quick connectivity test to MongoDB.
+
+    Runs a simple ping with a 5 second deadline on the shared client, so the
+    connection it opens is reused by the rest of the run. Returns True if
+    successful, False otherwise.
+    """
+    try:
+        client = get_client(connection_string)
+        with pymongo.timeout(5):
+            # Run a simple admin ping to verify connectivity
+            client.admin.command('ping')
+        # Optionally touch the target DB to ensure we can access it
+        _ = client[db_name].name
+        print(f"MongoDB connectivity OK for {connection_string} (db: {db_name})")
+        return True
+    except Exception as e:
+        print(f"MongoDB connectivity check FAILED: {e}")
+        return False
+
+
+def get_stock_symbols_range(connection_string, db_name, start_rank=1, end_rank=None):
+    """
+    Fetch stock symbols from MongoDB sorted by marketCap descending.
+
+    start_rank / end_rank are 1-based and inclusive.  end_rank=None means
+    fetch from start_rank to the end of the collection.
+    """
+    try:
+        db = get_client(connection_string)[db_name]
+        stocks_collection = db['stocks']
+
+        skip = start_rank - 1
+        limit = (end_rank - start_rank + 1) if end_rank is not None else 0
+
+        # _id breaks marketCap ties so rank slices are stable across runs
+        cursor = stocks_collection.find({}, {'symbol': 1, '_id': 0}) \
+                                  .sort([('marketCap', -1), ('_id', 1)]) \
+                                  .skip(skip)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+
+        return [s['symbol'] for s in cursor]
+
+    except PyMongoError as e:
+        print(f"Error fetching stock symbols: {e}")
+        return []
+
+
+class RequestThrottle:
+    """
+    Spaces out requests to PSX. wait() blocks until a random interval drawn
+    from [min_delay, max_delay] has passed since the previous request started,
+    so time already spent fetching and saving counts toward the delay instead
+    of being followed by a full sleep.
+    """
+
+    def __init__(self):
+        self._last_request = None
+        self._lock = threading.Lock()
+
+    def wait(self, min_delay, max_delay):
+        """
+        Block until the next request may start and return the seconds slept.
+        The start time is reserved under the lock and the sleep happens after
+        releasing it, so other threads can reserve the following slots
+        meanwhile.
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = now
+            if self._last_request is not None:
+                start = max(now, self._last_request + random.uniform(min_delay, max_delay))
+            self._last_request = start
+        delay = start - now
+        if delay:
+            time.sleep(delay)
+        return delay
@@ -3,12 +3,9 @@ import json
 import logging
 from datetime import datetime
 from typing import Dict, List, Any
-from pymongo import MongoClient
+from psx.data_store import get_client
 from psx.dividend_scraper import DividendScraper
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Load environment variables
@@ -21,8 +18,7 @@ except ImportError:
 def connect_to_db():
     connection_string = os.getenv("FINHISAAB_PRIMARY_DB_MONGO_URI", "mongodb://192.168.0.131:27017/")
     db_name = os.getenv("FINHISAAB_PRIMARY_DB_NAME", "finhisaab")
-    client = MongoClient(connection_string)
-    return client[db_name]
+    return get_client(connection_string)[db_name]
 
 def run_audit(json_file_path: str, output_file_path: str, day_tolerance: int = 0, amount_tolerance: float = 0.0, has_face_value: bool = False):
     db = connect_to_db()
@@ -223,6 +219,9 @@ if __name__ == "__main__":
     parser.add_argument("--amount-tolerance", type=float, default=0.0, help="Amount tolerance for discrepancy")
     parser.add_argument("--has-face-value", action="store_true", help="Audit only stocks that HAVE a faceValue")
     args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
     run_audit(args.json, args.out, args.tolerance, args.amount_tolerance, args.has_face_value)
 
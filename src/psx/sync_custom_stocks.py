@@ -14,7 +14,8 @@ import datetime
 import argparse
 import pandas as pd
 from psx import stocks
-from psx.data_store import save_to_mongodb, connect_to_mongodb
+from psx.data_store import save_to_mongodb, connect_to_mongodb, setup_logging
+from psx.mongodb_helpers import test_mongo_connectivity
 
 # Load environment variables from a .env file if python-dotenv is available
 try:
@@ -38,22 +39,8 @@ DEFAULT_DRY_RUN = False
 # ==============================================================================
 
 
-def test_mongo_connectivity(connection_string: str, db_name: str) -> bool:
-    """
-    Perform a quick connectivity test to MongoDB.
-    """
-    try:
-        from pymongo import MongoClient
-        client = MongoClient(connection_string, serverSelectionTimeoutMS=5000)
-        client.admin.command('ping')
-        client.close()
-        return True
-    except Exception as e:
-        print(f"[-] MongoDB connectivity check FAILED: {e}")
-        return False
-
-
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(
         description="Sync selected PSX symbols from a custom start date to MongoDB."
     )
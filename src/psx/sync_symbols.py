@@ -1,7 +1,9 @@
 import os
+import re
 import argparse
 from curl_cffi import requests
-from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from psx.data_store import get_client, ensure_stock_indexes, setup_logging, BULK_WRITE_BATCH_SIZE
 import pandas as pd
 
 # Load environment variables from a .env file if python-dotenv is available
@@ -11,6 +13,9 @@ try:
 except Exception:
     pass
 
+# Rights issues carry an "(r)" / "(R)" marker in their name
+RIGHTS_PATTERN = re.compile(r'\(r\)', re.IGNORECASE)
+
 def fetch_psx_symbols():
     url = "https://dps.psx.com.pk/symbols"
     print(f"Fetching symbols from {url} ...")
@@ -27,19 +32,17 @@ def fetch_psx_symbols():
     return response.json()
 
 def get_db_symbols(connection_string, db_name):
-    client = MongoClient(connection_string)
-    db = client[db_name]
-    stocks_collection = db['stocks']
+    stocks_collection = get_client(connection_string)[db_name]['stocks']
     
-    symbols = stocks_collection.find({}, {'symbol': 1, '_id': 0})
-    return {s['symbol'] for s in symbols}
+    # distinct walks the symbol index (DISTINCT_SCAN) without reading any
+    # stock document; main() ensures the index exists
+    return set(stocks_collection.distinct('symbol'))
 
 def add_missing_symbols(connection_string, db_name, missing_symbols_data):
     if not missing_symbols_data:
         return
 
-    client = MongoClient(connection_string)
-    db = client[db_name]
+    db = get_client(connection_string)[db_name]
     stocks_collection = db['stocks']
     
     # We may want to add basic fields found in the API
@@ -48,10 +51,22 @@ def add_missing_symbols(connection_string, db_name, missing_symbols_data):
     
     # Optional: we can add them to the database
     print(f"Inserting {len(missing_symbols_data)} new symbols into the database...")
-    result = stocks_collection.insert_many(missing_symbols_data)
-    print(f"Successfully inserted {len(result.inserted_ids)} symbols.")
+    # Unordered batches: one rejected symbol (e.g. a duplicate) does not stop
+    # the rest from being inserted
+    inserted_count = 0
+    for start in range(0, len(missing_symbols_data), BULK_WRITE_BATCH_SIZE):
+        batch = missing_symbols_data[start:start + BULK_WRITE_BATCH_SIZE]
+        try:
+            result = stocks_collection.insert_many(batch, ordered=False)
+            inserted_count += len(result.inserted_ids)
+        except BulkWriteError as bwe:
+            inserted_count += bwe.details.get('nInserted', 0)
+            errors = bwe.details.get('writeErrors', [])
+            print(f"Skipped {len(errors)} symbols that could not be inserted: {errors[0].get('errmsg') if errors else bwe}")
+    print(f"Successfully inserted {inserted_count} symbols.")
 
 def main():
+    setup_logging()
     parser = argparse.ArgumentParser(description="Find and optionally sync missing PSX symbols to MongoDB.")
     parser.add_argument("--add", action="store_true", help="Add the missing symbols to the database")
     args = parser.parse_args()
@@ -66,39 +81,49 @@ def main():
         print(f"Failed to fetch symbols from PSX: {e}")
         return
 
-    psx_symbols_dict = {}
-    for item in psx_data:
-        if item.get('isDebt', False):
-            continue
-            
-        name = item.get('name', '').strip()
-        if not name or '(r)' in name.lower() or name == '()':
-            continue
-            
-        psx_symbols_dict[item['symbol']] = item
+    # Keep equities with a real name: drop debt instruments, blank names,
+    # rights ("(r)") and "()" placeholders. The checks run as vectorized
+    # string ops; the original API items are kept for insertion.
+    listing = pd.DataFrame(psx_data)
+    for column, default in (('isDebt', False), ('name', '')):
+        if column not in listing:
+            listing[column] = default
+    is_debt = listing['isDebt'].fillna(False).astype(bool)
+    names = listing['name'].fillna('').astype(str).str.strip()
+    keep = (
+        ~is_debt
+        & (names != '')
+        & ~names.str.contains(RIGHTS_PATTERN, regex=True)
+        & (names != '()')
+    )
+    psx_symbols_dict = {
+        item['symbol']: item
+        for item, kept in zip(psx_data, keep.tolist()) if kept
+    }
     
     print("Connecting to MongoDB to get existing symbols...")
     try:
+        ensure_stock_indexes(get_client(connection_string)[db_name])
         db_symbols = get_db_symbols(connection_string, db_name)
     except Exception as e:
         print(f"Failed to connect to MongoDB: {e}")
         return
 
-    missing_symbols = set(psx_symbols_dict.keys()) - db_symbols
+    # Items for symbols PSX lists but the database lacks, sorted once by symbol
+    missing_data_to_insert = [
+        psx_symbols_dict[sym] for sym in sorted(psx_symbols_dict.keys() - db_symbols)
+    ]
     
-    if not missing_symbols:
+    if not missing_data_to_insert:
         print("No missing symbols found. The database is up to date.")
         return
         
-    print(f"\nFound {len(missing_symbols)} missing symbols:")
-    missing_data_to_insert = []
-    
-    # Print the missing symbols and aggregate data for insertion
-    for sym in sorted(missing_symbols):
-        print(f" - {sym} ({psx_symbols_dict[sym].get('name', 'N/A')})")
-        missing_data_to_insert.append(psx_symbols_dict[sym])
+    print(f"\nFound {len(missing_data_to_insert)} missing symbols:")
+    print("\n".join(
+        f" - {item['symbol']} ({item.get('name', 'N/A')})" for item in missing_data_to_insert
+    ))
     
-    print(f"\nTotal missing symbols: {len(missing_symbols)}")
+    print(f"\nTotal missing symbols: {len(missing_data_to_insert)}")
     
     if args.add:
         try:
@@ -1,5 +1,4 @@
 from concurrent.futures import ThreadPoolExecutor, as_completed, _base
-from dateutil.relativedelta import relativedelta
 from pandas import DataFrame as container
 from bs4 import BeautifulSoup as parser
 from collections import defaultdict
@@ -7,6 +6,7 @@ from datetime import datetime, date
 from typing import Union
 from tqdm import tqdm
 
+import functools
 import threading
 import pandas as pd
 import numpy as np
@@ -42,8 +42,8 @@ class DataReader:
     def tickers(self):
         return pd.read_json(self.__symbols)
 
-    def get_psx_data(self, symbol: str, dates: list) -> container:
-        data = futures = []
+    def get_psx_data(self, symbol: str, dates: tuple) -> container:
+        data, futures = [], []
         
         with tqdm(total=len(dates), desc="Downloading {}'s Data".format(symbol)) as progressbar:
 
@@ -99,16 +99,16 @@ class DataReader:
 
         return pd.DataFrame(stocks, columns=self.headers).set_index("TIME")
 
-    def daterange(self, start: date, end: date) -> list:
-        current = datetime(start.year, start.month, 1)
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def daterange(start: date, end: date) -> tuple:
+        # first day of every month from start's month through end's month;
+        # cached since every stocks() call in a run asks for the same range
+        first = datetime(start.year, start.month, 1)
         last = datetime(end.year, end.month, 1)
-        
-        dates = []
-        while current <= last:
-            dates.append(current)
-            current += relativedelta(months=1)
+        dates = tuple(pd.date_range(first, last, freq="MS").to_pydatetime().tolist())
             
-        return dates if dates else [start]
+        return dates if dates else (start,)
 
     def preprocess(self, data: list) -> pd.DataFrame:
         # concatenate each frame to a single dataframe
@@ -0,0 +1,196 @@
+"""
+Tests for the price conversion and upsert helpers in psx.data_store.
+No MongoDB server is needed: the pipeline update is run on mongomock and
+bulk_upsert is driven with a fake collection.
+"""
+
+import datetime
+
+import bson
+import numpy as np
+import pandas as pd
+import pytest
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError
+
+from psx.data_store import (
+    DUPLICATE_KEY_ERROR, build_upsert_operations, bulk_upsert, dataframe_to_documents
+)
+
+
+def price_frame(rows):
+    """DataFrame shaped like psx.stocks() output for one symbol."""
+    df = pd.DataFrame(rows, columns=['Date', 'Open', 'High', 'Low', 'Close', 'Volume'])
+    return df.set_index('Date')
+
+
+def test_dataframe_to_documents_converts_prices_to_paisa():
+    df = price_frame([
+        ('2024-01-02', 10.0, 10.5, 9.75, 10.25, 1500),
+        ('2024-01-03', 0.125, 0.135, 0.115, 0.145, 0),
+    ])
+
+    docs = dataframe_to_documents(df, 'ABC')
+
+    assert docs == [
+        {'symbol': 'ABC', 'date': datetime.datetime(2024, 1, 2),
+         'open': 1000, 'high': 1050, 'low': 975, 'close': 1025, 'volume': 1500.0},
+        # np.rint rounds half to even, like round()
+        {'symbol': 'ABC', 'date': datetime.datetime(2024, 1, 3),
+         'open': 12, 'high': round(0.135 * 100), 'low': round(0.115 * 100),
+         'close': round(0.145 * 100), 'volume': 0.0},
+    ]
+    assert all(type(doc['open']) is int for doc in docs)
+    assert all(type(doc['date']) is datetime.datetime for doc in docs)
+
+
+def test_dataframe_to_documents_rejects_missing_prices():
+    df = price_frame([
+        ('2024-01-02', 10.0, 10.5, np.nan, 10.25, 1500),
+    ])
+
+    with pytest.raises(ValueError, match='ABC'):
+        dataframe_to_documents(df, 'ABC')
+
+
+def test_dataframe_to_documents_allows_missing_volume():
+    df = price_frame([
+        ('2024-01-02', 10.0, 10.5, 9.75, 10.25, np.nan),
+    ])
+
+    docs = dataframe_to_documents(df, 'ABC')
+
+    assert np.isnan(docs[0]['volume'])
+
+
+def test_dataframe_to_documents_empty_frame():
+    assert dataframe_to_documents(price_frame([]), 'ABC') == []
+
+
+def test_build_upsert_operations_matches_on_symbol_and_date():
+    docs = [
+        {'symbol': 'ABC', 'date': datetime.datetime(2024, 1, 2),
+         'open': 1, 'high': 2, 'low': 1, 'close': 2, 'volume': 10.0},
+        {'symbol': 'XYZ', 'date': datetime.datetime(2024, 1, 2),
+         'open': 3, 'high': 4, 'low': 3, 'close': 4, 'volume': 20.0},
+    ]
+
+    operations = build_upsert_operations(docs)
+
+    assert [op._filter for op in operations] == [
+        {'symbol': 'ABC', 'date': datetime.datetime(2024, 1, 2)},
+        {'symbol': 'XYZ', 'date': datetime.datetime(2024, 1, 2)},
+    ]
+    assert all(op._upsert for op in operations)
+    stage = bson.decode(operations[0]._doc[0].raw)['$set']
+    assert {field: stage[field] for field in ('open', 'high', 'low', 'close', 'volume')} == {
+        'open': 1, 'high': 2, 'low': 1, 'close': 2, 'volume': 10.0
+    }
+    assert set(stage['updatedAt']) == {'$cond'}
+    assert set(stage['createdAt']) == {'$ifNull'}
+
+
+class TestPipelineUpdate:
+    """The $cond / $ifNull stage, run by mongomock's aggregation engine."""
+
+    @pytest.fixture
+    def collection(self):
+        mongomock = pytest.importorskip('mongomock')
+        return mongomock.MongoClient().db.prices
+
+    @staticmethod
+    def apply(collection, docs):
+        """Run the upserts one by one; returns the modified count."""
+        modified = 0
+        for op in build_upsert_operations(docs):
+            pipeline = [bson.decode(stage.raw) for stage in op._doc]
+            modified += collection.update_one(op._filter, pipeline, upsert=op._upsert).modified_count
+        return modified
+
+    @staticmethod
+    def doc(close):
+        return {'symbol': 'ABC', 'date': datetime.datetime(2024, 1, 2),
+                'open': 100, 'high': 110, 'low': 90, 'close': close, 'volume': 1000.0}
+
+    def test_insert_sets_both_timestamps(self, collection):
+        self.apply(collection, [self.doc(105)])
+
+        stored = collection.find_one({'symbol': 'ABC'})
+        assert stored['close'] == 105
+        assert stored['createdAt'] == stored['updatedAt']
+
+    def test_unchanged_prices_keep_the_document(self, collection):
+        self.apply(collection, [self.doc(105)])
+        before = collection.find_one({'symbol': 'ABC'})
+
+        assert self.apply(collection, [self.doc(105)]) == 0
+        assert collection.find_one({'symbol': 'ABC'}) == before
+
+    def test_changed_prices_bump_updated_at_only(self, collection):
+        self.apply(collection, [self.doc(105)])
+        collection.update_one({'symbol': 'ABC'}, {'$set': {
+            'createdAt': datetime.datetime(2020, 1, 1),
+            'updatedAt': datetime.datetime(2020, 1, 1),
+        }})
+
+        assert self.apply(collection, [self.doc(106)]) == 1
+        after = collection.find_one({'symbol': 'ABC'})
+        assert after['close'] == 106
+        assert after['createdAt'] == datetime.datetime(2020, 1, 1)
+        assert after['updatedAt'] > datetime.datetime(2020, 1, 1)
+
+
+class FakeResult:
+    def __init__(self, upserted_count, modified_count):
+        self.upserted_count = upserted_count
+        self.modified_count = modified_count
+
+
+class FakeCollection:
+    """Records bulk_write calls and replays the queued results or errors."""
+
+    def __init__(self, outcomes, write_concern=WriteConcern()):
+        self.outcomes = list(outcomes)
+        self.write_concern = write_concern
+        self.calls = []
+
+    def bulk_write(self, operations, ordered=True, bypass_document_validation=False):
+        self.calls.append((list(operations), ordered, bypass_document_validation))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def test_bulk_upsert_batches_and_sums_counts():
+    collection = FakeCollection([FakeResult(2, 0), FakeResult(1, 1), FakeResult(0, 1)])
+
+    result = bulk_upsert(collection, list(range(5)), batch_size=2)
+
+    assert result == (3, 2, [])
+    assert [ops for ops, _, _ in collection.calls] == [[0, 1], [2, 3], [4]]
+    assert all(not ordered and bypass for _, ordered, bypass in collection.calls)
+
+
+def test_bulk_upsert_drops_duplicate_key_errors():
+    other_error = {'index': 1, 'code': 121, 'errmsg': 'Document failed validation'}
+    collection = FakeCollection([BulkWriteError({
+        'nUpserted': 1,
+        'nModified': 0,
+        'writeErrors': [
+            {'index': 0, 'code': DUPLICATE_KEY_ERROR, 'errmsg': 'E11000 duplicate key'},
+            other_error,
+        ],
+    })])
+
+    result = bulk_upsert(collection, ['a', 'b', 'c'])
+
+    assert result == (1, 0, [other_error])
+
+
+def test_bulk_upsert_unacknowledged_returns_no_counts():
+    collection = FakeCollection([FakeResult(0, 0)], write_concern=WriteConcern(w=0))
+
+    assert bulk_upsert(collection, ['a']) == (None, None, [])
+    # Validation cannot be bypassed on unacknowledged writes
+    assert collection.calls[0][2] is False
@@ -0,0 +1,28 @@
+"""
+Tests for ex-date parsing in psx.dividend_scraper.
+"""
+
+import pandas as pd
+
+from psx.dividend_scraper import DividendScraper
+
+
+def test_parse_dates_handles_every_probe_format():
+    dates = pd.Series([
+        '20 Apr 2026', '20-Apr-2026', '20/04/2026', '2026-04-20',
+        'April 20, 2026', ' 20 April 2026 ',
+    ])
+
+    parsed = DividendScraper(cache_path=None).parse_dates(dates)
+
+    assert parsed.tolist() == [pd.Timestamp('2026-04-20')] * len(dates)
+
+
+def test_parse_dates_leaves_unknown_formats_as_nat():
+    dates = pd.Series(['20 Apr 2026', 'not a date', '', '31/02/2026'], index=[5, 6, 7, 8])
+
+    parsed = DividendScraper(cache_path=None).parse_dates(dates)
+
+    assert parsed.index.tolist() == [5, 6, 7, 8]
+    assert parsed[5] == pd.Timestamp('2026-04-20')
+    assert parsed[[6, 7, 8]].isna().all()
@@ -0,0 +1,75 @@
+"""
+Tests for the column-wise document building in psx.dividend_store.
+"""
+
+import datetime
+
+import pandas as pd
+
+from psx.dividend_store import process_announcements
+
+
+def announcements(*rows):
+    return pd.DataFrame(rows, columns=[
+        'symbol', 'x_date', 'sector', 'announcement_type', 'dividend', 'bonus'
+    ])
+
+
+def test_process_announcements_empty():
+    assert process_announcements(pd.DataFrame(), {}) == ([], [])
+
+
+def test_process_announcements_builds_dividends_and_bonuses():
+    df = announcements(
+        ('ABC', pd.Timestamp('2026-04-20'), 'Banks', ['dividend', 'bonus'], 20.0, '10%'),
+        ('XYZ', pd.Timestamp('2026-05-04'), 'Cement', ['dividend'], 35.0, ''),
+    )
+
+    dividends, bonuses = process_announcements(df, {'XYZ': 5.0})
+
+    assert [(d['symbol'], d['faceValue'], d['amountPerShare']) for d in dividends] == [
+        ('ABC', 10.0, 2.0),     # default face value
+        ('XYZ', 5.0, 1.75),
+    ]
+    abc = dividends[0]
+    assert abc['exDate'] == abc['payDate'] == datetime.datetime(2026, 4, 20)
+    assert type(abc['exDate']) is datetime.datetime
+    assert abc['status'] == 'ANNOUNCED'
+    assert abc['metadata'] == {'source': 'scstrade', 'notes': 'Sector: Banks'}
+    assert type(abc['createdAt']) is datetime.datetime
+
+    assert len(bonuses) == 1
+    assert bonuses[0]['symbol'] == 'ABC'
+    assert bonuses[0]['bonusPercentage'] == 10.0
+    assert bonuses[0]['bonusType'] == 'BONUS_SHARES'
+    assert bonuses[0]['exDate'] == datetime.datetime(2026, 4, 20)
+
+
+def test_process_announcements_skips_invalid_rows():
+    df = announcements(
+        ('', pd.Timestamp('2026-04-20'), 'Banks', ['dividend'], 20.0, ''),     # no symbol
+        ('ABC', pd.NaT, 'Banks', ['dividend'], 20.0, ''),                       # no ex-date
+        ('DEF', pd.Timestamp('2026-04-20'), None, ['dividend'], 0.0, ''),       # zero dividend
+        ('GHI', pd.Timestamp('2026-04-20'), None, ['bonus'], None, 'n/a'),      # unparsable bonus
+        ('JKL', pd.Timestamp('2026-04-20'), None, ['bonus'], 15.0, '25 %'),
+    )
+
+    dividends, bonuses = process_announcements(df, {})
+
+    assert dividends == []
+    assert [(b['symbol'], b['bonusPercentage']) for b in bonuses] == [('JKL', 25.0)]
+    assert bonuses[0]['metadata'] == {'source': 'scstrade', 'notes': 'Sector: '}
+
+
+def test_process_announcements_warns_about_unparsable_dividends(caplog):
+    df = announcements(
+        ('ABC', pd.Timestamp('2026-04-20'), 'Banks', ['dividend'], 'abc', ''),
+        ('DEF', pd.Timestamp('2026-04-20'), 'Banks', ['dividend'], None, ''),
+        ('GHI', pd.Timestamp('2026-04-20'), 'Banks', ['bonus'], 'xyz', '10'),
+    )
+
+    with caplog.at_level('WARNING', logger='psx.dividend_store'):
+        dividends, _ = process_announcements(df, {})
+
+    assert dividends == []
+    assert [r.getMessage() for r in caplog.records] == ["Could not parse dividend amount for ABC"]
@@ -0,0 +1,115 @@
+"""
+Tests for the date helpers and the streamed report in psx.find_missing_data.
+"""
+
+import datetime
+import json
+import os
+
+from psx.find_missing_data import (
+    MissingDataReport, expected_business_dates, exclusions_hash, group_missing_dates,
+    is_known_complete
+)
+
+
+def d(day):
+    return datetime.date.fromisoformat(day)
+
+
+def test_group_missing_dates_empty():
+    assert group_missing_dates([]) == []
+
+
+def test_group_missing_dates_joins_across_weekends():
+    # Thu, Fri, Mon, Tue: one range despite the weekend in between
+    missing = [d('2024-01-04'), d('2024-01-05'), d('2024-01-08'), d('2024-01-09')]
+
+    assert group_missing_dates(missing, 1) == [{'start': '2024-01-04', 'end': '2024-01-09'}]
+
+
+def test_group_missing_dates_splits_and_drops_small_gaps():
+    missing = [
+        d('2024-01-02'),                                    # 1 business day
+        d('2024-01-10'), d('2024-01-11'),                   # 2 business days
+        d('2024-02-01'), d('2024-02-02'), d('2024-02-05'),  # 3 business days
+    ]
+
+    assert group_missing_dates(missing, 1) == [
+        {'start': '2024-01-10', 'end': '2024-01-11'},
+        {'start': '2024-02-01', 'end': '2024-02-05'},
+    ]
+    assert group_missing_dates(missing, 2) == [
+        {'start': '2024-02-01', 'end': '2024-02-05'},
+    ]
+    assert len(group_missing_dates(missing, 0)) == 3
+
+
+def test_expected_business_dates_skips_weekends_and_exclusions():
+    exclusions = [{'start': '2024-01-03', 'end': '2024-01-04'}]
+
+    dates = expected_business_dates(d('2024-01-01'), d('2024-01-09'), exclusions)
+
+    assert sorted(dates) == [
+        d('2024-01-01'), d('2024-01-02'), d('2024-01-05'), d('2024-01-08'), d('2024-01-09')
+    ]
+
+
+def test_exclusions_hash_ignores_order_and_duplicates():
+    a = {'start': '2024-01-03', 'end': '2024-01-04'}
+    b = {'start': '2024-02-05', 'end': '2024-02-05'}
+
+    assert exclusions_hash([a, b]) == exclusions_hash([b, a, a])
+    assert exclusions_hash([a]) != exclusions_hash([a, b])
+    assert exclusions_hash(None) == exclusions_hash([])
+
+
+def test_is_known_complete_requires_matching_exclusions():
+    key = exclusions_hash([{'start': '2024-01-03', 'end': '2024-01-04'}])
+    meta = {
+        'complete_since': datetime.datetime(2024, 1, 1),
+        'last_complete_date': datetime.datetime(2024, 3, 1),
+        'exclusions_hash': key,
+    }
+
+    assert is_known_complete(meta, d('2024-01-02'), d('2024-02-29'), key)
+    assert not is_known_complete(meta, d('2023-12-29'), d('2024-02-29'), key)
+    assert not is_known_complete(meta, d('2024-01-02'), d('2024-02-29'), exclusions_hash())
+    assert not is_known_complete({k: v for k, v in meta.items() if k != 'exclusions_hash'},
+                                 d('2024-01-02'), d('2024-02-29'), key)
+
+
+def test_missing_data_report_close_writes_json(tmp_path):
+    path = str(tmp_path / 'report.json')
+    report = MissingDataReport(path)
+    report.add('ABC', [{'start': '2024-01-02', 'end': '2024-01-05'}])
+    report.add('XYZ', [{'start': '2024-02-01', 'end': '2024-02-02'}])
+
+    assert report.close()
+    report.abort()
+
+    with open(path) as f:
+        assert json.load(f) == {
+            'ABC': [{'start': '2024-01-02', 'end': '2024-01-05'}],
+            'XYZ': [{'start': '2024-02-01', 'end': '2024-02-02'}],
+        }
+    assert os.listdir(tmp_path) == ['report.json']
+
+
+def test_missing_data_report_without_gaps_writes_nothing(tmp_path):
+    report = MissingDataReport(str(tmp_path / 'report.json'))
+
+    assert not report.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_missing_data_report_abort_keeps_previous_report(tmp_path):
+    path = tmp_path / 'report.json'
+    path.write_text('{"OLD": []}\n')
+    report = MissingDataReport(str(path))
+    report.add('ABC', [{'start': '2024-01-02', 'end': '2024-01-05'}])
+
+    report.abort()
+
+    assert report._file.closed
+    assert os.listdir(tmp_path) == ['report.json']
+    assert path.read_text() == '{"OLD": []}\n'
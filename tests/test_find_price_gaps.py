@@ -0,0 +1,50 @@
+"""
+Tests for psx.find_price_gaps.find_symbol_gaps.
+"""
+
+import numpy as np
+
+from psx.find_price_gaps import find_symbol_gaps
+
+
+def calendar(*days):
+    """(epoch milliseconds, YYYY-MM-DD strings) for the given days."""
+    dates = np.array(days, dtype='datetime64[D]')
+    return dates.astype('datetime64[ms]').astype(np.int64), [str(day) for day in dates]
+
+
+MASTER_MS, MASTER_DAYS = calendar(
+    '2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05',
+    '2024-01-08', '2024-01-09', '2024-01-10',
+)
+
+
+def test_no_gaps():
+    assert find_symbol_gaps(MASTER_MS[2:6], MASTER_MS, MASTER_DAYS) == []
+
+
+def test_gaps_between_first_and_last_date():
+    symbol_ms = MASTER_MS[[0, 1, 4, 6]]
+
+    assert find_symbol_gaps(symbol_ms, MASTER_MS, MASTER_DAYS) == [
+        {'start': '2024-01-03', 'end': '2024-01-04',
+         'missing_trading_days': 2, 'last_actual_date': '2024-01-02'},
+        {'start': '2024-01-08', 'end': '2024-01-08',
+         'missing_trading_days': 1, 'last_actual_date': '2024-01-05'},
+    ]
+
+
+def test_days_outside_the_symbol_history_are_not_gaps():
+    # Listed on the 3rd and last traded on the 8th
+    symbol_ms = MASTER_MS[[2, 5]]
+
+    gaps = find_symbol_gaps(symbol_ms, MASTER_MS, MASTER_DAYS)
+
+    assert gaps == [{'start': '2024-01-04', 'end': '2024-01-05',
+                     'missing_trading_days': 2, 'last_actual_date': '2024-01-03'}]
+
+
+def test_unknown_dates_at_the_ends_give_no_result():
+    outside_ms, _ = calendar('2024-01-11')
+
+    assert find_symbol_gaps(np.concatenate((MASTER_MS[:2], outside_ms)), MASTER_MS, MASTER_DAYS) == []